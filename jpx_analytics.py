@@ -0,0 +1,184 @@
+"""
+スナップショット・限月ごとの集計指標(ATM IV、25デルタスキュー、プット・コール・レシオ、最大ペイン)を
+option_analytics テーブルに作るためのモジュールです。
+
+取込時に save_jpx_to_db から1スナップショットずつ計算して保存する。
+過去分はこのスクリプトを実行して jpx_history で一定のメモリで読みながらバックフィルする。
+"""
+import argparse
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import func
+
+import jpx_history
+import jpx_validator
+from webapp import db
+from webapp.models import Option, OptionType, OptionAnalytics
+from my_logging import getLogger
+
+# スキューを測るデルタ
+SKEW_DELTA = 0.25
+
+# バックフィルで1回に読んでcommitする期間
+BACKFILL_WINDOW = timedelta(days=1)
+
+log = getLogger(__name__)
+
+
+def _value(x):
+    # NaNはNoneとして保存する
+    return None if np.isnan(x) else float(x)
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator > 0 else None
+
+
+def iv_at_delta(arrays, delta):
+    # デルタに対してIVを線形補間する。範囲外は外挿せずにNaN。
+    valid = ~np.isnan(arrays.delta) & ~np.isnan(arrays.iv)
+    if np.count_nonzero(valid) < 2:
+        return np.nan
+
+    order = np.argsort(arrays.delta[valid])
+    deltas = arrays.delta[valid][order]
+    ivs = arrays.iv[valid][order]
+
+    if delta < deltas[0] or delta > deltas[-1]:
+        return np.nan
+
+    return np.interp(delta, deltas, ivs)
+
+
+def max_pain(calls, puts):
+    # 満期の価格が各権利行使価格だった場合の買い手の受取総額が最小になる権利行使価格
+    call_positions = np.nan_to_num(calls.positions)
+    put_positions = np.nan_to_num(puts.positions)
+    if call_positions.sum() + put_positions.sum() == 0:
+        return None
+
+    settlement = np.union1d(calls.target_price, puts.target_price)
+    payout = np.maximum(settlement[:, None] - calls.target_price[None, :], 0).dot(call_positions) \
+        + np.maximum(puts.target_price[None, :] - settlement[:, None], 0).dot(put_positions)
+
+    return int(settlement[np.argmin(payout)])
+
+
+def compute_analytics(call_option_list, put_option_list, updated_at):
+    # Option でも jpx_history.OptionRow でもよい
+    if len(call_option_list) == 0 or len(put_option_list) == 0:
+        return None
+
+    calls = jpx_validator.to_arrays(OptionType.CALL, call_option_list)
+    puts = jpx_validator.to_arrays(OptionType.PUT, put_option_list)
+
+    atm_target_price = None
+    atm_iv = np.nan
+    atm = np.flatnonzero(calls.is_atm)
+    if len(atm) > 0:
+        atm_target_price = int(calls.target_price[atm[0]])
+        atm_ivs = np.concatenate([calls.iv[calls.target_price == atm_target_price],
+                                  puts.iv[puts.target_price == atm_target_price]])
+        if not np.isnan(atm_ivs).all():
+            atm_iv = np.nanmean(atm_ivs)
+
+    call_iv_25d = iv_at_delta(calls, SKEW_DELTA)
+    put_iv_25d = iv_at_delta(puts, -SKEW_DELTA)
+
+    call_volume = int(np.nansum(calls.volume))
+    put_volume = int(np.nansum(puts.volume))
+    call_positions = int(np.nansum(calls.positions))
+    put_positions = int(np.nansum(puts.positions))
+
+    return OptionAnalytics(
+        None,
+        call_option_list[0].last_trading_day,
+        atm_target_price,
+        _value(atm_iv),
+        _value(call_iv_25d),
+        _value(put_iv_25d),
+        _value(put_iv_25d - call_iv_25d),
+        call_volume,
+        put_volume,
+        _ratio(put_volume, call_volume),
+        call_positions,
+        put_positions,
+        _ratio(put_positions, call_positions),
+        max_pain(calls, puts),
+        updated_at,
+    )
+
+
+def compute_jpx_analytics(jpx):
+    return compute_analytics(jpx.call_option_list, jpx.put_option_list, jpx.updated_at)
+
+
+def get_analytics(last_trading_day, updated_at=None):
+    # 指定時刻(省略時は最新)以前で最新の集計指標を1行返す
+    # jpx_loader の取引最終日はdatetimeなので、そのままだと日時として比較されて一致しない
+    if isinstance(last_trading_day, datetime):
+        last_trading_day = last_trading_day.date()
+    q = db.session.query(OptionAnalytics).filter(OptionAnalytics.last_trading_day == last_trading_day)
+    if updated_at is not None:
+        q = q.filter(OptionAnalytics.updated_at <= updated_at)
+    return q.order_by(OptionAnalytics.updated_at.desc()).first()
+
+
+def _backfill_window(since, until):
+    # 1区間分を読み切ってからcommitする。済んでいるキーもこの区間の分だけ読む。
+    session = db.session
+
+    q = session.query(OptionAnalytics.updated_at, OptionAnalytics.last_trading_day)\
+        .filter(OptionAnalytics.updated_at >= since, OptionAnalytics.updated_at < until)
+    done = {(row.updated_at, row.last_trading_day) for row in q}
+
+    count = 0
+    rows = jpx_history.iter_option_rows(since, until)
+    for key, option_rows in groupby(rows, key=lambda o: (o.updated_at, o.last_trading_day)):
+        if key in done:
+            continue
+
+        option_rows = list(option_rows)
+        analytics = compute_analytics([o for o in option_rows if o.type == OptionType.CALL],
+                                      [o for o in option_rows if o.type == OptionType.PUT],
+                                      key[0])
+        if analytics is None:
+            continue
+
+        session.add(analytics)
+        count += 1
+
+    # 履歴を読むカーソルは閉じているので、ここでcommitして書き込みロックを手放す
+    session.commit()
+
+    return count
+
+
+def backfill(since=None, until=None):
+    session = db.session
+
+    first_updated_at, last_updated_at = session.query(func.min(Option.updated_at), func.max(Option.updated_at)).one()
+    if first_updated_at is None:
+        return
+
+    since = since if since is not None else first_updated_at
+    until = until if until is not None else last_updated_at + timedelta(seconds=1)
+
+    # 取込処理を長くブロックしないように、BACKFILL_WINDOW ずつ区切って読み直してはcommitする
+    count = 0
+    window_start = since
+    while window_start < until:
+        window_end = min(window_start + BACKFILL_WINDOW, until)
+        count += _backfill_window(window_start, window_end)
+        log.debug('computed analytics of %d snapshots. (until %s)', count, window_end)
+        window_start = window_end
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='backfill option analytics for stored snapshots.')
+    jpx_history.add_period_arguments(parser)
+    args = parser.parse_args()
+
+    backfill(args.since, args.until)
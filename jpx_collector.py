@@ -0,0 +1,82 @@
+"""
+jpx_loader に登録されたページを並行して取得するためのモジュールです。
+
+全ページで1つのコネクションプールを共有し、ページごとの最短取得間隔を守りながら
+スレッドプールでダウンロードとパースを行う。検証と保存は呼び出し側(jpx_importer)で行う。
+"""
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import jpx_loader
+from my_logging import getLogger
+
+# 同時に取得するページ数
+DEFAULT_MAX_WORKERS = 4
+
+log = getLogger(__name__)
+
+# jpx は取得に失敗した場合はNone。その場合 error に sys.exc_info() が入る。
+FetchResult = namedtuple('FetchResult', ('source', 'jpx', 'error'))
+
+
+class Collector:
+
+    def __init__(self, sources=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.sources = list(sources if sources is not None else jpx_loader.SOURCES.values())
+
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__lock = threading.Lock()
+        # name -> 次に取得してよい時刻(time.monotonic)
+        self.__next_fetch_time = {}
+
+    @property
+    def primary_sources(self):
+        return [s for s in self.sources if s.is_primary]
+
+    @property
+    def secondary_sources(self):
+        return [s for s in self.sources if not s.is_primary]
+
+    def __wait_for_turn(self, source):
+        # 取得枠をロックの中で予約してから、ロックの外で待つ
+        with self.__lock:
+            now = time.monotonic()
+            fetch_time = max(now, self.__next_fetch_time.get(source.name, now))
+            self.__next_fetch_time[source.name] = fetch_time + source.min_interval
+
+        wait = fetch_time - time.monotonic()
+        if wait > 0:
+            log.debug('waiting %.1f sec for rate limit of %s', wait, source.name)
+            time.sleep(wait)
+
+    def fetch(self, source):
+        self.__wait_for_turn(source)
+
+        log.debug('fetching %s: %s', source.name, source.url)
+        return jpx_loader.load_jpx_source(source, self.session)
+
+    def __fetch_result(self, source):
+        try:
+            return FetchResult(source, self.fetch(source), None)
+        except:
+            return FetchResult(source, None, sys.exc_info())
+
+    def fetch_all(self, sources):
+        # 並行して取得し、結果は sources と同じ順番で返す
+        futures = [self.__executor.submit(self.__fetch_result, source) for source in sources]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self.__executor.shutdown()
+        self.session.close()
@@ -0,0 +1,139 @@
+"""
+optionテーブルの長期間の履歴を一定のメモリで読むためのモジュールです。
+
+query(...).all() のように全行をORMオブジェクトにせず、ストリーミングカーソルから
+chunk_size 行ずつ読み出して、軽量なnamedtupleかNumPyの列ごとの配列として返す。
+AwareDateTime や日付、列挙型の変換は1行ずつではなくチャンク単位でまとめて行う。
+"""
+from collections import namedtuple, OrderedDict
+from datetime import datetime, date
+
+import numpy as np
+from sqlalchemy import select, type_coerce, Integer, String
+
+from jpx_loader import TZ_JST
+from webapp import db
+from webapp.models import Option, AwareDateTime, EnumType
+
+# 1回のフェッチで読み込む行数
+DEFAULT_CHUNK_SIZE = 10000
+
+OPTION_COLUMNS = tuple(c.name for c in Option.__table__.columns if c.name != 'id')
+
+# Optionと同じ属性名を持つので、Optionの代わりに検証やフィットの処理にそのまま渡せる
+OptionRow = namedtuple('OptionRow', OPTION_COLUMNS)
+
+
+def _raw_column(column):
+    # 型の変換をDBドライバとTypeDecoratorに任せず、DBの値をそのまま読む
+    if isinstance(column.type, (AwareDateTime, EnumType, db.Boolean)):
+        return type_coerce(column, Integer).label(column.name)
+    if isinstance(column.type, db.Date):
+        return type_coerce(column, String).label(column.name)
+    return column
+
+
+def _option_select(columns, since, until, last_trading_day):
+    table = Option.__table__
+
+    stmt = select([_raw_column(table.c[name]) for name in columns])
+    if since is not None:
+        stmt = stmt.where(table.c.updated_at >= since)
+    if until is not None:
+        stmt = stmt.where(table.c.updated_at < until)
+    if last_trading_day is not None:
+        # jpx_loader の取引最終日はdatetimeなので、そのままだと日時として比較されて一致しない
+        if isinstance(last_trading_day, datetime):
+            last_trading_day = last_trading_day.date()
+        stmt = stmt.where(table.c.last_trading_day == last_trading_day)
+
+    return stmt.order_by(table.c.updated_at, table.c.last_trading_day, table.c.type, table.c.target_price)
+
+
+def _iter_chunks(stmt, chunk_size):
+    # サーバサイドカーソル(SQLiteではドライバが逐次フェッチする)で chunk_size 行ずつ読む
+    result = db.session.connection().execution_options(stream_results=True).execute(stmt)
+    try:
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        result.close()
+
+
+def _convert_memoized(values, convert):
+    # 同じチャンク内では同じ値(updated_at など)が何度も出てくるので、ユニークな値だけ変換する
+    cache = {None: None}
+    for v in set(values):
+        if v not in cache:
+            cache[v] = convert(v)
+    return [cache[v] for v in values]
+
+
+def _to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=TZ_JST)
+
+
+def _to_date(value):
+    return date(*map(int, value.split('-')))
+
+
+def _row_converter(column):
+    if isinstance(column.type, AwareDateTime):
+        return lambda values: _convert_memoized(values, _to_datetime)
+    if isinstance(column.type, EnumType):
+        return lambda values: _convert_memoized(values, column.type.enum_class)
+    if isinstance(column.type, db.Boolean):
+        return lambda values: _convert_memoized(values, bool)
+    if isinstance(column.type, db.Date):
+        return lambda values: _convert_memoized(values, _to_date)
+    return None
+
+
+def _array_converter(column):
+    # 日時はUTCのdatetime64[s]、日付はdatetime64[D]、欠損値はNaTやNaNにする
+    if isinstance(column.type, AwareDateTime):
+        return lambda values: np.array(values, dtype='datetime64[s]')
+    if isinstance(column.type, db.Date):
+        return lambda values: np.array(values, dtype='datetime64[D]')
+    if isinstance(column.type, db.Boolean):
+        return lambda values: np.array(values, dtype=bool)
+    if isinstance(column.type, (EnumType, db.Integer)) and not column.nullable:
+        return lambda values: np.array(values, dtype=np.int64)
+    return lambda values: np.array(values, dtype=float)
+
+
+def parse_datetime(value):
+    # コマンドラインで指定されたJSTの日時
+    return TZ_JST.localize(datetime.strptime(value, '%Y/%m/%d %H:%M'))
+
+
+def add_period_arguments(parser):
+    # 履歴を読むスクリプトで共通の期間指定 [since, until)
+    parser.add_argument('--since', type=parse_datetime, help='e.g. "2019/04/01 09:00" (JST)')
+    parser.add_argument('--until', type=parse_datetime, help='e.g. "2019/04/30 15:15" (JST)')
+
+
+def iter_option_rows(since=None, until=None, last_trading_day=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # updated_at, 取引最終日, CALL/PUT, 権利行使価格 の順に OptionRow を1行ずつ返す
+    table = Option.__table__
+    converters = [_row_converter(table.c[name]) for name in OPTION_COLUMNS]
+
+    for rows in _iter_chunks(_option_select(OPTION_COLUMNS, since, until, last_trading_day), chunk_size):
+        columns = [convert(list(values)) if convert is not None else values
+                   for convert, values in zip(converters, zip(*rows))]
+        for values in zip(*columns):
+            yield OptionRow(*values)
+
+
+def iter_option_batches(since=None, until=None, last_trading_day=None, columns=OPTION_COLUMNS,
+                        chunk_size=DEFAULT_CHUNK_SIZE):
+    # 最大 chunk_size 行ずつ、列名 -> NumPy配列 の OrderedDict を返す
+    table = Option.__table__
+    converters = [_array_converter(table.c[name]) for name in columns]
+
+    for rows in _iter_chunks(_option_select(columns, since, until, last_trading_day), chunk_size):
+        yield OrderedDict((name, convert(values))
+                          for name, convert, values in zip(columns, converters, zip(*rows)))
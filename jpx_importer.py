@@ -2,18 +2,57 @@
 JPXでオプション価格の更新が有った場合にオプション価格、
 先物価格、現物価格をデータベースに保存するためのスクリプト
 """
+import argparse
+import os
+import pickle
 import sys
+import time
 
 from sqlalchemy import func
 
+import jpx_analytics
+import jpx_collector
 import jpx_loader
-from webapp import db
-from webapp.models import Option, FuturePriceInfo, SpotPriceInfo
+import jpx_surface
+import jpx_validator
+from webapp import app, db
+from webapp.models import Option, FuturePriceInfo, SpotPriceInfo, OptionValidationIssue
 from my_logging import  getLogger
 
 log = getLogger(__name__)
 
 
+def quarantine_jpx(jpx):
+    # 検証でERRORとなったスナップショットは後から調べられるようにファイルに退避しておく
+    quarantine_dir = app.config['QUARANTINE_DIR']
+    os.makedirs(quarantine_dir, exist_ok=True)
+
+    last_trading_day = jpx.call_option_list[0].last_trading_day if jpx.call_option_list else None
+    file_name = '{:%Y%m%d%H%M}_{}.pickle'.format(
+        jpx.updated_at, '{:%Y%m%d}'.format(last_trading_day) if last_trading_day else 'unknown')
+    file_path = os.path.join(quarantine_dir, file_name)
+
+    with open(file_path, mode='wb') as f:
+        pickle.dump(jpx, f)
+
+    return file_path
+
+
+def save_validation_issues(jpx, result):
+    last_trading_day = jpx.call_option_list[0].last_trading_day if jpx.call_option_list else None
+
+    db.session.add_all([OptionValidationIssue(
+        None,
+        issue.check_name,
+        issue.severity,
+        issue.type,
+        issue.target_price,
+        issue.message,
+        last_trading_day,
+        jpx.updated_at,
+    ) for issue in result.issues])
+
+
 def save_jpx_to_db(jpx):
     session = db.session
 
@@ -33,6 +72,15 @@ def save_jpx_to_db(jpx):
     else:
         log.debug('not saving future and spot price. already saved.')
 
+    result = jpx_validator.validate_jpx(jpx)
+    save_validation_issues(jpx, result)
+
+    if result.is_quarantined:
+        # ATMが特定できない等、そのまま保存すると後続の処理が壊れるものは隔離する
+        file_path = quarantine_jpx(jpx)
+        log.warning('option prices are quarantined. issues: %d, file: %s', len(result.issues), file_path)
+        return False
+
     option_type =  next(filter(lambda o: o.is_atm, jpx.call_option_list))
     log.debug('saving call option prices. cf, atm option is: %s', option_type)
     session.add_all(jpx.call_option_list)
@@ -41,12 +89,24 @@ def save_jpx_to_db(jpx):
     log.debug('saving put option prices. cf, atm option is: %s', option_type)
     session.add_all(jpx.put_option_list)
 
+    # 保存と同時にスマイルをフィットしてキャッシュしておく
+    smile = jpx_surface.fit_jpx(jpx)
+    if smile is not None:
+        log.debug('saving vol smile: %s', smile)
+        session.add(jpx_surface.to_model(smile, jpx.updated_at))
+
+    # ダッシュボード用の集計指標も同時に保存する
+    analytics = jpx_analytics.compute_jpx_analytics(jpx)
+    if analytics is not None:
+        log.debug('saving option analytics: %s', analytics)
+        session.add(analytics)
+
     log.debug('save jpx to db..done!')
 
     return True
 
 
-def do_import(file_path):
+def do_import(file_path, collector=None):
     session = db.session
 
     t = session.query(func.max(FuturePriceInfo.updated_at).label('max_updated_at')).subquery('t')
@@ -76,40 +136,52 @@ def do_import(file_path):
 
     else:
         # webから読み込む
+        # collector が渡されていなければ今回だけ使うものを作る
+        own_collector = collector is None
+        if own_collector:
+            collector = jpx_collector.Collector()
 
-        # 期近オプション
-        jpx = jpx_loader.load_jpx_nearby_month()
+        try:
+            # 更新の有無を判定するページ(期近オプション)
+            updated_jpx_list = []
+            for result in collector.fetch_all(collector.primary_sources):
+                if result.error is not None:
+                    raise result.error[1].with_traceback(result.error[2])
 
-        log.debug('updated_at on jpxweb: %s', jpx.updated_at)
-        log.debug('future price time on jpxweb: %s', jpx.future_price_info.price_time)
+                jpx = result.jpx
 
-        is_updated = (last_price_time is None
-                      or (jpx.updated_at > last_updated_at
-                          and jpx.future_price_info.price_time is not None
-                          and last_price_time != jpx.future_price_info.price_time))
+                log.debug('updated_at on jpxweb(%s): %s', result.source.name, jpx.updated_at)
+                log.debug('future price time on jpxweb(%s): %s', result.source.name, jpx.future_price_info.price_time)
 
-        log.debug('is_updated: %s', is_updated)
+                is_updated = (last_price_time is None
+                              or (jpx.updated_at > last_updated_at
+                                  and jpx.future_price_info.price_time is not None
+                                  and last_price_time != jpx.future_price_info.price_time))
 
-        if is_updated:
-            # 期近オプションを保存
-            save_jpx_to_db(jpx)
-
-            # 次限月オプション
-            try:
-                jpx = jpx_loader.load_jpx_nearby_month_2nd()
-                save_jpx_to_db(jpx)
-            except:
-                log.warning("Unexpected error: %s", sys.exc_info()[0], exc_info=True)
-
-            # 次の先物限月のオプション(次のMSQの月)
-            try:
-                jpx = jpx_loader.load_jpx_nearby_month_3rd()
-                save_jpx_to_db(jpx)
-            except:
-                log.warning("Unexpected error: %s", sys.exc_info()[0], exc_info=True)
+                log.debug('is_updated: %s', is_updated)
 
-        else:
-            log.debug('skipping..')
+                if is_updated:
+                    updated_jpx_list.append(jpx)
+
+            if updated_jpx_list:
+                for jpx in updated_jpx_list:
+                    save_jpx_to_db(jpx)
+
+                # それ以外のページ(次限月、次の先物限月のオプション等)は並行して取得する
+                for result in collector.fetch_all(collector.secondary_sources):
+                    try:
+                        if result.error is not None:
+                            raise result.error[1].with_traceback(result.error[2])
+                        save_jpx_to_db(result.jpx)
+                    except:
+                        log.warning("Unexpected error: %s", sys.exc_info()[0], exc_info=True)
+
+            else:
+                log.debug('skipping..')
+
+        finally:
+            if own_collector:
+                collector.close()
 
     session.commit()
 
@@ -165,9 +237,27 @@ def bulk_import(file_path):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='import jpx option prices to db.')
     # 引数でHTMLファイルが指定されていればそれを読み込む
-    file_path_arg = sys.argv[1] if len(sys.argv) >= 2 else None
-
-    do_import(file_path_arg)
+    parser.add_argument('file_path', nargs='?', help='jpx html file. loads from the web if omitted.')
+    parser.add_argument('--interval', type=float,
+                        help='keep polling the web every INTERVAL seconds with one shared collector.')
+    args = parser.parse_args()
 
-    # bulk_import(file_path_arg)
+    if args.interval is None:
+        do_import(args.file_path)
+    else:
+        # コネクションプールと取得間隔を引き継ぐために同じcollectorを使い回す
+        collector = jpx_collector.Collector()
+        try:
+            while True:
+                try:
+                    do_import(None, collector)
+                except Exception:
+                    log.warning("Unexpected error: %s", sys.exc_info()[0], exc_info=True)
+                    db.session.rollback()
+                time.sleep(args.interval)
+        finally:
+            collector.close()
+
+    # bulk_import(args.file_path)
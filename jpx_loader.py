@@ -2,7 +2,7 @@
 日本取引所グループのウェブサイトから日経225オプションの価格をダウンロードするためのモジュールです。
 """
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from datetime import datetime, timedelta
 from pytz import timezone
 import re
@@ -26,11 +26,25 @@ JPX_URL_NEARBY_1ST = 'https://svc.qri.jp/jpx/nkopm/'
 JPX_URL_NEARBY_2ND ='https://svc.qri.jp/jpx/nkopm/1'
 JPX_URL_NEARBY_3RD ='https://svc.qri.jp/jpx/nkopm/2'
 
+# 同じページを取得する最短間隔(秒)
+DEFAULT_MIN_INTERVAL = 30
+
 log = getLogger(__name__)
 
 Item = namedtuple('Item', ('title', 'url', 'user', 'body'))
 JpxOptionPriceInfo = namedtuple('JpxOptionPriceInfo', ('spot_price_info', 'future_price_info', 'call_option_list', 'put_option_list', 'updated_at'))
 
+# 取得対象のページ
+#  name: ページの名前
+#  url: ページのURL
+#  parser: HTMLから JpxOptionPriceInfo を作る関数
+#  min_interval: 同じページを取得する最短間隔(秒)
+#  is_primary: Trueのページに更新が有った場合だけ、それ以外のページも取得する
+JpxSource = namedtuple('JpxSource', ('name', 'url', 'parser', 'min_interval', 'is_primary'))
+
+# name -> JpxSource。取得対象のページは register_source で1ページずつ登録する。
+SOURCES = OrderedDict()
+
 
 def load_html_from_file(file_path):
     # ローカルファイルWebからHTMLをロード
@@ -42,8 +56,9 @@ def load_html_from_file(file_path):
     return html
 
 
-def load_html_from_web(url):
+def load_html_from_web(url, session=None):
     # WebからHTMLをロード
+    # session を渡すとそのコネクションプールを使う
 
     headers = {
         'Referer': 'https://svc.qri.jp/jpx/nkopm/2',
@@ -51,7 +66,7 @@ def load_html_from_web(url):
         'Cache-Control': 'no-cache'
     }
 
-    response = requests.get(url, headers=headers)
+    response = (session or requests).get(url, headers=headers)
 
     html = response.content
 
@@ -393,16 +408,30 @@ def load_jpx_from_file(file_path):
     return parse_jpx_html(html)
 
 
+def register_source(name, url, parser=parse_jpx_html, min_interval=DEFAULT_MIN_INTERVAL, is_primary=False):
+    source = JpxSource(name, url, parser, min_interval, is_primary)
+    SOURCES[name] = source
+    return source
+
+
+def load_jpx_source(source, session=None):
+    html = load_html_from_web(source.url, session)
+    return source.parser(html)
+
+
+# 日経225オプション 期近、次限月、次の先物限月(次のMSQの月)
+register_source('nk225_option_nearby_1st', JPX_URL_NEARBY_1ST, is_primary=True)
+register_source('nk225_option_nearby_2nd', JPX_URL_NEARBY_2ND)
+register_source('nk225_option_nearby_3rd', JPX_URL_NEARBY_3RD)
+
+
 def load_jpx_nearby_month():
-    html = load_html_from_web(JPX_URL_NEARBY_1ST)
-    return parse_jpx_html(html)
+    return load_jpx_source(SOURCES['nk225_option_nearby_1st'])
 
 
 def load_jpx_nearby_month_2nd():
-    html = load_html_from_web(JPX_URL_NEARBY_2ND)
-    return parse_jpx_html(html)
+    return load_jpx_source(SOURCES['nk225_option_nearby_2nd'])
 
 
 def load_jpx_nearby_month_3rd():
-    html = load_html_from_web(JPX_URL_NEARBY_3RD)
-    return parse_jpx_html(html)
+    return load_jpx_source(SOURCES['nk225_option_nearby_3rd'])
@@ -0,0 +1,120 @@
+"""
+DBに保存済みのスナップショットを updated_at の順に JpxOptionPriceInfo として再生するためのスクリプト
+
+検証処理やキャッシュ、売買ロジックのテスト用に、過去のスナップショットを
+実時間(または指定倍速)か最速で後続の処理に流し込む。
+option テーブルは jpx_history で OptionRow として、future_price_info、spot_price_info は yield_per で
+それぞれ少しずつ読みながら updated_at でマージするので、期間が長くてもメモリ使用量は一定。
+"""
+import argparse
+import time
+from collections import namedtuple
+from itertools import groupby
+
+import jpx_history
+import jpx_validator
+from jpx_loader import JpxOptionPriceInfo
+from webapp import db
+from webapp.models import OptionType, FuturePriceInfo, SpotPriceInfo
+from my_logging import getLogger
+
+# 1回のフェッチで読み込む行数
+DEFAULT_CHUNK_SIZE = 1000
+
+log = getLogger(__name__)
+
+ReplayStats = namedtuple('ReplayStats', ('events', 'elapsed', 'events_per_sec'))
+
+
+def _query_by_updated_at(model, since, until):
+    q = db.session.query(model)
+    if since is not None:
+        q = q.filter(model.updated_at >= since)
+    if until is not None:
+        q = q.filter(model.updated_at < until)
+    return q.order_by(model.updated_at)
+
+
+class _Follower:
+    # updated_at順に並んだストリームを、問い合わせられた時刻まで読み進めるためのカーソル
+
+    def __init__(self, rows):
+        self.__rows = iter(rows)
+        self.__current = next(self.__rows, None)
+
+    def find(self, updated_at):
+        while self.__current is not None and self.__current.updated_at < updated_at:
+            self.__current = next(self.__rows, None)
+
+        if self.__current is not None and self.__current.updated_at == updated_at:
+            return self.__current
+
+        return None
+
+
+def iter_snapshots(since=None, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # (updated_at, 取引最終日)ごとに1つの JpxOptionPriceInfo を返す
+    options = jpx_history.iter_option_rows(since, until, chunk_size=chunk_size)
+    futures = _query_by_updated_at(FuturePriceInfo, since, until)
+    spots = _query_by_updated_at(SpotPriceInfo, since, until)
+
+    future_follower = _Follower(futures.yield_per(chunk_size))
+    spot_follower = _Follower(spots.yield_per(chunk_size))
+
+    for (updated_at, _), rows in groupby(options, key=lambda o: (o.updated_at, o.last_trading_day)):
+        call_option_list = []
+        put_option_list = []
+        for o in rows:
+            if o.type == OptionType.CALL:
+                call_option_list.append(o)
+            else:
+                put_option_list.append(o)
+
+        # 保持ポリシー等で先物＆現物価格が残っていない時刻はNoneになる
+        yield JpxOptionPriceInfo(spot_follower.find(updated_at), future_follower.find(updated_at),
+                                 call_option_list, put_option_list, updated_at)
+
+
+def replay(handler, since=None, until=None, speed=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # speed が None なら最速、1.0 なら実時間、60 なら60倍速で handler にスナップショットを渡す
+    if speed is not None and speed <= 0:
+        raise ValueError('speed must be positive: {}'.format(speed))
+
+    events = 0
+    first_updated_at = None
+    start = time.perf_counter()
+
+    for jpx in iter_snapshots(since, until, chunk_size):
+        if speed is not None:
+            if first_updated_at is None:
+                first_updated_at = jpx.updated_at
+
+            wait = (jpx.updated_at - first_updated_at).total_seconds() / speed - (time.perf_counter() - start)
+            if wait > 0:
+                time.sleep(wait)
+
+        handler(jpx)
+        events += 1
+
+    elapsed = time.perf_counter() - start
+    stats = ReplayStats(events, elapsed, events / elapsed if elapsed > 0 else 0.0)
+
+    log.info('replayed %d snapshots in %.3f sec. (%.1f events/sec)', stats.events, stats.elapsed, stats.events_per_sec)
+
+    return stats
+
+
+def _speed(value):
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError('speed must be positive: {}'.format(value))
+    return speed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='replay stored snapshots through the validator.')
+    jpx_history.add_period_arguments(parser)
+    parser.add_argument('--speed', type=_speed, help='replay speed. 1.0 is wall-clock. as fast as possible if omitted.')
+    args = parser.parse_args()
+
+    replay(jpx_validator.validate_jpx, args.since, args.until, args.speed)
@@ -0,0 +1,262 @@
+"""
+古いスナップショットを保持ポリシーに従って間引くためのスクリプト
+
+取引最終日を過ぎた限月のオプション価格と、どのオプション価格からも参照されなくなった
+先物＆現物価格、それと取込時の検証結果を、経過日数に応じた解像度(15分足、日足など)まで間引く。
+間引いたレコードはgzip圧縮したCSVに退避してから削除する。
+
+取込処理を止めないように、1限月1日分ずつ小さなトランザクションで処理し、
+その都度インクリメンタルバキュームで空き領域を返す。
+"""
+import argparse
+import csv
+import gzip
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from jpx_loader import TZ_JST
+from webapp import app, db
+from my_logging import getLogger
+
+# updated_at(unixtime)をJSTの日付や15分足に揃えるためのオフセット
+JST_OFFSET = 9 * 60 * 60
+SECONDS_PER_DAY = 24 * 60 * 60
+
+# SQLiteの auto_vacuum = INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+log = getLogger(__name__)
+
+
+def day_start(dt):
+    # JSTでその日の0時のunixtime
+    d = dt.astimezone(TZ_JST)
+    return int(TZ_JST.localize(datetime(d.year, d.month, d.day)).timestamp())
+
+
+def retention_windows(now, policy):
+    # ポリシーを (下限, 上限, 解像度) の区間に変換する。一番古い区間の下限はNone(無制限)。
+    cutoffs = [day_start(now - timedelta(days=age)) for age, _ in policy]
+
+    windows = []
+    for i, (_, resolution) in enumerate(policy):
+        upper = cutoffs[i]
+        lower = cutoffs[i + 1] if i + 1 < len(cutoffs) else None
+        windows.append((lower, upper, resolution))
+
+    return windows
+
+
+def _range_condition(lower):
+    if lower is None:
+        return 'updated_at < :upper'
+    return 'updated_at >= :lower AND updated_at < :upper'
+
+
+def _days_with_data(conn, table, condition, params, lower, upper):
+    # データの有る日(JST)だけを返す
+    sql = 'SELECT DISTINCT (updated_at + :offset) / :day FROM {} WHERE {} AND {} ORDER BY 1'.format(
+        table, condition, _range_condition(lower))
+    params = dict(params, offset=JST_OFFSET, day=SECONDS_PER_DAY, upper=upper)
+    if lower is not None:
+        params['lower'] = lower
+    rows = conn.execute(text(sql), params)
+    return [row[0] * SECONDS_PER_DAY - JST_OFFSET for row in rows]
+
+
+def _archive_path(file_name):
+    archive_dir = app.config['ARCHIVE_DIR']
+    os.makedirs(archive_dir, exist_ok=True)
+    return os.path.join(archive_dir, file_name)
+
+
+def _write_pending_archive(file_path, result):
+    # 削除がコミットされるまでは一時ファイルに書いておく
+    first = result.fetchone()
+    if first is None:
+        return 0
+
+    # 同じ日を後からより粗い解像度で間引いた場合は同じファイルに追記するので、ヘッダは最初だけ
+    write_header = not os.path.exists(file_path)
+
+    count = 0
+    with gzip.open(file_path + '.pending', mode='wt', encoding='UTF-8', newline='') as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(result.keys())
+        writer.writerow(first)
+        count += 1
+        for row in result:
+            writer.writerow(row)
+            count += 1
+
+    return count
+
+
+def _commit_archive(file_path):
+    # gzipは複数のメンバを連結しても1つのファイルとして読めるので、一時ファイルをそのまま追記する
+    pending_path = file_path + '.pending'
+    with open(pending_path, mode='rb') as src, open(file_path, mode='ab') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(pending_path)
+
+
+def _recover_archive(file_path):
+    # 前回、削除をコミットした後で一時ファイルを追記する前に落ちていた場合は、上書きする前にまず追記する。
+    # コミット前に落ちていた分も含まれうるが、その行は次に退避する分と重複するだけで失われはしない。
+    if os.path.exists(file_path + '.pending'):
+        log.warning('appending leftover pending archive: %s.pending', file_path)
+        _commit_archive(file_path)
+
+
+def _discard_archive(file_path):
+    pending_path = file_path + '.pending'
+    if os.path.exists(pending_path):
+        os.remove(pending_path)
+
+
+def _vacuum(conn):
+    if conn.execute(text('PRAGMA auto_vacuum')).scalar() != AUTO_VACUUM_INCREMENTAL:
+        return
+
+    # incremental_vacuum は1ステップで1ページしか解放しないので、
+    # 最後までステップを進める executescript をDBAPIのコネクションで直接使う
+    conn.connection.executescript('PRAGMA incremental_vacuum({:d});'.format(app.config['RETENTION_VACUUM_PAGES']))
+
+
+def _downsample_chunk(table, condition, params, start, resolution, archive_name, extra_condition=''):
+    # 1日分を1トランザクションで間引く。各バケットで最後のスナップショットだけを残す。
+    where = '{} AND updated_at >= :start AND updated_at < :end{}'.format(condition, extra_condition)
+    kept = 'SELECT max(updated_at) FROM {} WHERE {} AND updated_at >= :start AND updated_at < :end ' \
+           'GROUP BY (updated_at + :offset) / :resolution'.format(table, condition)
+    target = '{} AND updated_at NOT IN ({})'.format(where, kept)
+
+    params = dict(params, start=start, end=start + SECONDS_PER_DAY, offset=JST_OFFSET, resolution=resolution)
+
+    archive_path = _archive_path(archive_name)
+    _recover_archive(archive_path)
+
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text('PRAGMA busy_timeout = 30000'))
+
+            rows = conn.execute(text('SELECT * FROM {} WHERE {} ORDER BY updated_at'.format(table, target)), params)
+            archived = _write_pending_archive(archive_path, rows)
+
+            if archived == 0:
+                return 0
+
+            deleted = conn.execute(text('DELETE FROM {} WHERE {}'.format(table, target)), params).rowcount
+    except:
+        # 削除がコミットされなかった行は次回もう一度退避されるので、今回の分は捨てる
+        _discard_archive(archive_path)
+        raise
+
+    _commit_archive(archive_path)
+
+    with db.engine.connect() as conn:
+        _vacuum(conn)
+
+    time.sleep(app.config['RETENTION_CHUNK_INTERVAL'])
+
+    return deleted
+
+
+def downsample_options(now, policy):
+    today = datetime.fromtimestamp(day_start(now), tz=TZ_JST).date()
+
+    with db.engine.connect() as conn:
+        expired = [row[0] for row in conn.execute(
+            text('SELECT DISTINCT last_trading_day FROM option WHERE last_trading_day < :today ORDER BY 1'),
+            today=today.isoformat())]
+
+    total = 0
+    for last_trading_day in expired:
+        condition = 'last_trading_day = :last_trading_day'
+        params = {'last_trading_day': last_trading_day}
+
+        for lower, upper, resolution in retention_windows(now, policy):
+            with db.engine.connect() as conn:
+                days = _days_with_data(conn, 'option', condition, params, lower, upper)
+
+            for start in days:
+                archive_name = 'option_{}_{:%Y%m%d}.csv.gz'.format(
+                    last_trading_day.replace('-', ''), datetime.fromtimestamp(start, tz=TZ_JST))
+                deleted = _downsample_chunk('option', condition, params, start, resolution, archive_name)
+                total += deleted
+
+                if deleted:
+                    log.debug('downsampled option. last_trading_day: %s, day: %s, resolution: %d, deleted: %d',
+                              last_trading_day, datetime.fromtimestamp(start, tz=TZ_JST), resolution, deleted)
+
+    return total
+
+
+def _downsample_table(table, now, policy, extra_condition=''):
+    total = 0
+    for lower, upper, resolution in retention_windows(now, policy):
+        with db.engine.connect() as conn:
+            days = _days_with_data(conn, table, '1 = 1', {}, lower, upper)
+
+        for start in days:
+            archive_name = '{}_{:%Y%m%d}.csv.gz'.format(table, datetime.fromtimestamp(start, tz=TZ_JST))
+            deleted = _downsample_chunk(table, '1 = 1', {}, start, resolution, archive_name, extra_condition)
+            total += deleted
+
+            if deleted:
+                log.debug('downsampled %s. day: %s, resolution: %d, deleted: %d',
+                          table, datetime.fromtimestamp(start, tz=TZ_JST), resolution, deleted)
+
+    return total
+
+
+def downsample_price_info(table, now, policy):
+    # まだオプション価格から参照されている時刻の先物＆現物価格は残しておく
+    referenced = ' AND NOT EXISTS (SELECT 1 FROM option WHERE option.updated_at = {}.updated_at)'.format(table)
+    return _downsample_table(table, now, policy, referenced)
+
+
+def downsample_validation_issues(now, policy):
+    # 検証結果は隔離されてオプション価格の無いスナップショットの分もあるので、限月やオプション価格の有無に関係なく
+    # 同じ解像度で間引く。各バケットでは最後に問題が見つかったスナップショットの分だけが残る。
+    return _downsample_table('option_validation_issue', now, policy)
+
+
+def enable_incremental_vacuum():
+    # auto_vacuumの変更はVACUUMしないと反映されない。DB全体を書き直すので取込処理を止めて一度だけ実行すること。
+    with db.engine.connect() as conn:
+        conn.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+        conn.execute(text('VACUUM'))
+
+
+def apply_retention_policy(now=None):
+    now = now if now is not None else datetime.now(tz=TZ_JST)
+    policy = sorted(app.config['RETENTION_POLICY'])
+
+    log.debug('retention windows: %s', retention_windows(now, policy))
+
+    deleted = downsample_options(now, policy)
+    log.debug('deleted option rows: %d', deleted)
+
+    for table in ('future_price_info', 'spot_price_info'):
+        deleted = downsample_price_info(table, now, policy)
+        log.debug('deleted %s rows: %d', table, deleted)
+
+    deleted = downsample_validation_issues(now, policy)
+    log.debug('deleted option_validation_issue rows: %d', deleted)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='apply retention policy to old snapshots.')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='switch the database to auto_vacuum=INCREMENTAL (runs a full VACUUM once).')
+    args = parser.parse_args()
+
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+
+    apply_retention_policy()
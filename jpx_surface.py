@@ -0,0 +1,316 @@
+"""
+スナップショットごとにボラティリティ・サーフェスをフィットして補間するためのモジュールです。
+
+限月ごとにOTMオプションのIVへSVIをフィットし、パラメータを vol_smile_param テーブルに
+updated_at をキーとして保存しておく。限月間はトータルバリアンスを残存期間で線形補間するので、
+任意の権利行使価格・残存期間のIVをNumPyでまとめて求められる。
+"""
+import argparse
+from collections import namedtuple, OrderedDict
+from datetime import datetime, timedelta
+from itertools import groupby
+from multiprocessing import Pool
+
+import numpy as np
+from sqlalchemy import exists
+
+import jpx_history
+import jpx_validator
+from jpx_loader import TZ_JST
+from webapp import app, db
+from webapp.models import Option, OptionType, FuturePriceInfo, VolSmileParam
+from my_logging import getLogger
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+# フィットに必要な最低限の点数
+MIN_POINTS = 5
+
+# SVIの m, sigma を探索するグリッドの1辺の点数と、グリッドを細かくしていく回数
+GRID_SIZE = 21
+REFINE_STEPS = 3
+
+# バックフィルで何スナップショットごとにコミットするか
+BACKFILL_COMMIT_INTERVAL = 100
+
+log = getLogger(__name__)
+
+SmileParams = namedtuple('SmileParams', ('last_trading_day', 'time_to_expiry', 'forward', 'a', 'b', 'rho', 'm', 'sigma',
+                                         'rmse', 'num_points'))
+
+# updated_at(unixtime) -> VolSurface
+_surface_cache = OrderedDict()
+
+
+def time_to_expiry(last_trading_day, updated_at):
+    # SQは取引最終日の翌営業日の寄り付きだが、簡単のため翌日の9:00とする
+    d = last_trading_day
+    expiry = TZ_JST.localize(datetime(d.year, d.month, d.day)) + timedelta(days=1, hours=9)
+    return (expiry - updated_at).total_seconds() / SECONDS_PER_YEAR
+
+
+def implied_forward(calls, puts, future_price_info, last_trading_day):
+    # C - P が最も小さい権利行使価格でプット・コール・パリティからフォワードを求める
+    if np.array_equal(calls.target_price, puts.target_price):
+        diff = (calls.bid + calls.ask) / 2 - (puts.bid + puts.ask) / 2
+        valid = ~np.isnan(diff)
+        if valid.any():
+            i = np.argmin(np.where(valid, np.abs(diff), np.inf))
+            return float(calls.target_price[i] + diff[i])
+
+    # 気配が無ければ同じ限月の先物価格、それも無ければATMの権利行使価格を使う
+    if future_price_info is not None and future_price_info.price is not None:
+        contract_month = future_price_info.contract_month
+        if (contract_month.year, contract_month.month) == (last_trading_day.year, last_trading_day.month):
+            return float(future_price_info.price)
+
+    atm = np.flatnonzero(calls.is_atm)
+    if len(atm) > 0:
+        return float(calls.target_price[atm[0]])
+
+    return None
+
+
+def _smile_iv(arrays):
+    # IVが無い行は売気配IVと買気配IVの仲値で補う
+    mid_iv = (arrays.bid_iv + arrays.ask_iv) / 2
+    return np.where(np.isnan(arrays.iv), mid_iv, arrays.iv)
+
+
+def _fit_linear(k, w, m, sigma):
+    # m, sigma を固定すると y = (k - m) / sigma として w = a + d * y + c * sqrt(y^2 + 1) は a, d, c について線形になる。
+    # グリッド上の全ての (m, sigma) について最小二乗でまとめて解く。
+    y = (k[None, :] - m[:, None]) / sigma[:, None]
+    z = np.sqrt(y ** 2 + 1)
+    x = np.stack([np.ones_like(y), y, z], axis=-1)
+
+    xtx = np.einsum('gni,gnj->gij', x, x)
+    xtw = np.einsum('gni,n->gi', x, w)
+    coef = np.einsum('gij,gj->gi', np.linalg.pinv(xtx), xtw)
+
+    # 制約: c >= 0, |d| <= c, トータルバリアンスの最小値 a + sqrt(c^2 - d^2) >= 0
+    c = np.clip(coef[:, 2], 0, None)
+    d = np.clip(coef[:, 1], -c, c)
+    a = np.mean(w[None, :] - d[:, None] * y - c[:, None] * z, axis=1)
+    a = np.maximum(a, -np.sqrt(c ** 2 - d ** 2))
+
+    residual = a[:, None] + d[:, None] * y + c[:, None] * z - w[None, :]
+    sse = np.sum(residual ** 2, axis=1)
+
+    return a, d, c, sse
+
+
+def fit_svi(k, w):
+    m_lower, m_upper = k.min(), k.max()
+    log_sigma_lower, log_sigma_upper = np.log(1e-3), np.log(1.0)
+
+    for _ in range(REFINE_STEPS):
+        m_grid, log_sigma_grid = np.meshgrid(np.linspace(m_lower, m_upper, GRID_SIZE),
+                                             np.linspace(log_sigma_lower, log_sigma_upper, GRID_SIZE))
+        m = m_grid.ravel()
+        sigma = np.exp(log_sigma_grid.ravel())
+
+        a, d, c, sse = _fit_linear(k, w, m, sigma)
+        best = np.argmin(sse)
+
+        # 最良点の周りにグリッドを狭めて探索し直す
+        m_step = (m_upper - m_lower) / (GRID_SIZE - 1)
+        log_sigma_step = (log_sigma_upper - log_sigma_lower) / (GRID_SIZE - 1)
+        m_lower, m_upper = m[best] - 2 * m_step, m[best] + 2 * m_step
+        log_sigma_lower, log_sigma_upper = np.log(sigma[best]) - 2 * log_sigma_step, np.log(sigma[best]) + 2 * log_sigma_step
+
+    # a, d, c を SVI の a, b, rho に戻す
+    b = c[best] / sigma[best]
+    rho = d[best] / c[best] if c[best] > 0 else 0.0
+    rmse = np.sqrt(sse[best] / len(k))
+
+    return float(a[best]), float(b), float(rho), float(m[best]), float(sigma[best]), float(rmse)
+
+
+def fit_smile(call_option_list, put_option_list, future_price_info, updated_at):
+    if len(call_option_list) == 0:
+        return None
+
+    last_trading_day = call_option_list[0].last_trading_day
+    t = time_to_expiry(last_trading_day, updated_at)
+    if t <= 0:
+        return None
+
+    calls = jpx_validator.to_arrays(OptionType.CALL, call_option_list)
+    puts = jpx_validator.to_arrays(OptionType.PUT, put_option_list)
+
+    forward = implied_forward(calls, puts, future_price_info, last_trading_day)
+    if forward is None:
+        return None
+
+    # フォワードより上はCALL、下はPUTのIVを使う
+    target_price = np.concatenate([calls.target_price[calls.target_price >= forward],
+                                   puts.target_price[puts.target_price < forward]])
+    iv = np.concatenate([_smile_iv(calls)[calls.target_price >= forward],
+                         _smile_iv(puts)[puts.target_price < forward]])
+
+    with np.errstate(invalid='ignore'):
+        valid = iv > 0
+
+    if np.count_nonzero(valid) < MIN_POINTS:
+        log.debug('too few points to fit smile. last_trading_day: %s, updated_at: %s', last_trading_day, updated_at)
+        return None
+
+    # IVは%表記
+    k = np.log(target_price[valid] / forward)
+    w = (iv[valid] / 100) ** 2 * t
+
+    a, b, rho, m, sigma, rmse = fit_svi(k, w)
+
+    return SmileParams(last_trading_day, t, forward, a, b, rho, m, sigma, rmse, int(np.count_nonzero(valid)))
+
+
+def fit_jpx(jpx):
+    return fit_smile(jpx.call_option_list, jpx.put_option_list, jpx.future_price_info, jpx.updated_at)
+
+
+def fit_snapshot(updated_at):
+    # DBに保存済みのスナップショットを限月ごとにフィットする
+    session = db.session
+
+    options = session.query(Option).filter(Option.updated_at == updated_at)\
+        .order_by(Option.last_trading_day, Option.type, Option.target_price).all()
+    future_price_info = session.query(FuturePriceInfo).filter(FuturePriceInfo.updated_at == updated_at).first()
+
+    smiles = []
+    for _, rows in groupby(options, key=lambda o: o.last_trading_day):
+        rows = list(rows)
+        smile = fit_smile([o for o in rows if o.type == OptionType.CALL],
+                          [o for o in rows if o.type == OptionType.PUT],
+                          future_price_info, updated_at)
+        if smile is not None:
+            smiles.append(smile)
+
+    return smiles
+
+
+def to_model(smile, updated_at):
+    return VolSmileParam(None, *smile, updated_at)
+
+
+class VolSurface:
+    # 1スナップショット分の限月ごとのSVIパラメータから任意の権利行使価格・残存期間のIVを求める
+
+    def __init__(self, smiles):
+        smiles = sorted(smiles, key=lambda s: s.time_to_expiry)
+        self.time_to_expiry = np.array([s.time_to_expiry for s in smiles])
+        self.forward = np.array([s.forward for s in smiles])
+        self.a = np.array([s.a for s in smiles])
+        self.b = np.array([s.b for s in smiles])
+        self.rho = np.array([s.rho for s in smiles])
+        self.m = np.array([s.m for s in smiles])
+        self.sigma = np.array([s.sigma for s in smiles])
+
+    def total_variance(self, strikes, times):
+        strikes, times = np.broadcast_arrays(np.asarray(strikes, dtype=float), np.asarray(times, dtype=float))
+        shape = strikes.shape
+        strikes = strikes.ravel()
+        times = times.ravel()
+
+        t = self.time_to_expiry
+
+        # 同じ log(K / F) で全限月のトータルバリアンスを求めてから残存期間方向に補間する
+        forward = np.interp(times, t, self.forward)
+        km = np.log(strikes / forward)[None, :] - self.m[:, None]
+        w = self.a[:, None] + self.b[:, None] * (self.rho[:, None] * km + np.sqrt(km ** 2 + self.sigma[:, None] ** 2))
+        w = np.maximum(w, 0)
+
+        columns = np.arange(len(strikes))
+        upper = np.clip(np.searchsorted(t, times), 1, len(t) - 1) if len(t) > 1 else np.zeros(len(times), dtype=int)
+        lower = np.maximum(upper - 1, 0)
+
+        span = t[upper] - t[lower]
+        weight = np.divide(times - t[lower], span, out=np.zeros(len(times)), where=span > 0)
+        result = w[lower, columns] + weight * (w[upper, columns] - w[lower, columns])
+
+        # 範囲外はIV一定として外挿する
+        before = times < t[0]
+        result[before] = w[0, before] * times[before] / t[0]
+        after = times > t[-1]
+        result[after] = w[-1, after] * times[after] / t[-1]
+
+        return result.reshape(shape)
+
+    def iv(self, strikes, times):
+        # IVは%表記で返す
+        times = np.asarray(times, dtype=float)
+        w = self.total_variance(strikes, times)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(w / times) * 100
+
+
+def get_surface(updated_at):
+    key = updated_at.timestamp()
+
+    surface = _surface_cache.get(key)
+    if surface is not None:
+        _surface_cache.move_to_end(key)
+        return surface
+
+    smiles = db.session.query(VolSmileParam).filter(VolSmileParam.updated_at == updated_at).all()
+
+    if len(smiles) == 0:
+        # 未フィットのスナップショットはその場でフィットするだけで保存はしない。
+        # 保存は取込処理(save_jpx_to_db)とバックフィルだけが行う。
+        smiles = fit_snapshot(updated_at)
+
+    if len(smiles) == 0:
+        return None
+
+    surface = VolSurface(smiles)
+
+    _surface_cache[key] = surface
+    if len(_surface_cache) > app.config['SURFACE_CACHE_SIZE']:
+        _surface_cache.popitem(last=False)
+
+    return surface
+
+
+def _init_worker():
+    # 親プロセスから引き継いだコネクションは使わない
+    db.session.remove()
+    db.engine.dispose()
+
+
+def _fit_worker(timestamp):
+    updated_at = datetime.fromtimestamp(timestamp, tz=TZ_JST)
+    return updated_at, fit_snapshot(updated_at)
+
+
+def backfill(since=None, until=None, processes=None):
+    session = db.session
+
+    q = session.query(Option.updated_at).distinct()\
+        .filter(~exists().where(VolSmileParam.updated_at == Option.updated_at))
+    if since is not None:
+        q = q.filter(Option.updated_at >= since)
+    if until is not None:
+        q = q.filter(Option.updated_at < until)
+
+    timestamps = [row.updated_at.timestamp() for row in q.order_by(Option.updated_at)]
+    log.debug('snapshots to fit: %d', len(timestamps))
+
+    # フィットは子プロセスで並列に行い、書き込みは親プロセスだけで行う
+    with Pool(processes, initializer=_init_worker) as pool:
+        for i, (updated_at, smiles) in enumerate(pool.imap_unordered(_fit_worker, timestamps, chunksize=16), 1):
+            session.add_all([to_model(s, updated_at) for s in smiles])
+
+            if i % BACKFILL_COMMIT_INTERVAL == 0:
+                session.commit()
+                log.debug('fitted %d/%d snapshots.', i, len(timestamps))
+
+    session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='fit volatility smiles for stored snapshots.')
+    jpx_history.add_period_arguments(parser)
+    parser.add_argument('--processes', type=int, help='number of worker processes. cpu count if omitted.')
+    args = parser.parse_args()
+
+    backfill(args.since, args.until, args.processes)
@@ -0,0 +1,213 @@
+"""
+JPXからパースしたオプション価格情報(スナップショット)を保存前に検証するためのモジュールです。
+
+各チェックは1スナップショット分の全行をNumPyの配列としてまとめて評価するので、
+取込処理をほとんど遅くしません。各チェックに掛かった時間も合わせて返します。
+"""
+
+from collections import namedtuple, OrderedDict
+import time
+
+import numpy as np
+
+from webapp import app
+from webapp.models import OptionType, ValidationSeverity
+from my_logging import getLogger
+
+log = getLogger(__name__)
+
+Issue = namedtuple('Issue', ('check_name', 'severity', 'type', 'target_price', 'message'))
+ValidationResult = namedtuple('ValidationResult', ('issues', 'check_costs', 'is_quarantined'))
+
+# 1限月・片側(CALL or PUT)分のオプション情報を列ごとの配列にしたもの
+OptionArrays = namedtuple('OptionArrays', ('type', 'target_price', 'is_atm', 'bid', 'ask', 'iv', 'bid_iv', 'ask_iv',
+                                           'volume', 'positions', 'delta', 'gamma', 'theta', 'vega'))
+
+GREEK_COLUMNS = ('delta', 'gamma', 'theta', 'vega')
+
+
+def _column(option_list, name):
+    # Noneは欠損値としてNaNにする
+    return np.array([getattr(o, name) for o in option_list], dtype=float)
+
+
+def to_arrays(option_type, option_list):
+    return OptionArrays(
+        option_type,
+        _column(option_list, 'target_price'),
+        np.array([bool(o.is_atm) for o in option_list], dtype=bool),
+        _column(option_list, 'bid'),
+        _column(option_list, 'ask'),
+        _column(option_list, 'iv'),
+        _column(option_list, 'bid_iv'),
+        _column(option_list, 'ask_iv'),
+        _column(option_list, 'volume'),
+        _column(option_list, 'positions'),
+        _column(option_list, 'delta'),
+        _column(option_list, 'gamma'),
+        _column(option_list, 'theta'),
+        _column(option_list, 'vega'),
+    )
+
+
+def _row_issues(check_name, severity, arrays, mask, message_format):
+    # マスクがTrueの行だけIssueにする
+    return [Issue(check_name, severity, arrays.type, int(arrays.target_price[i]), message_format.format(i=i))
+            for i in np.flatnonzero(mask)]
+
+
+def check_atm_count(jpx, calls, puts):
+    # ATMは片側にちょうど1つだけ存在するはず
+    issues = []
+    for arrays in (calls, puts):
+        count = int(np.count_nonzero(arrays.is_atm))
+        if count != 1:
+            issues.append(Issue('atm_count', ValidationSeverity.ERROR, arrays.type, None,
+                                'ATM count is {}. expected exactly 1.'.format(count)))
+    return issues
+
+
+def check_strike_monotonic(jpx, calls, puts):
+    # 権利行使価格は狭義単調(ページの並び順は問わない)、かつCALLとPUTで同じ並びのはず
+    issues = []
+    for arrays in (calls, puts):
+        diff = np.diff(arrays.target_price)
+        # 並び順は両端の権利行使価格で決め、それに逆らう行を検出する
+        direction = np.sign(arrays.target_price[-1] - arrays.target_price[0]) if len(diff) > 0 else 0
+        not_monotonic = np.insert(diff * direction <= 0, 0, False)
+        issues.extend(_row_issues('strike_monotonic', ValidationSeverity.ERROR, arrays, not_monotonic,
+                                  'target price is not monotonic at row {i}.'))
+
+    if not np.array_equal(calls.target_price, puts.target_price):
+        issues.append(Issue('strike_monotonic', ValidationSeverity.ERROR, None, None,
+                            'target prices of call and put do not match.'))
+    return issues
+
+
+def check_crossed_quote(jpx, calls, puts):
+    issues = []
+    for arrays in (calls, puts):
+        with np.errstate(invalid='ignore'):
+            crossed = arrays.bid > arrays.ask
+        issues.extend(_row_issues('crossed_quote', ValidationSeverity.WARNING, arrays, crossed,
+                                  'bid is greater than ask.'))
+    return issues
+
+
+def check_negative_iv(jpx, calls, puts):
+    issues = []
+    for arrays in (calls, puts):
+        with np.errstate(invalid='ignore'):
+            negative = (arrays.iv < 0) | (arrays.bid_iv < 0) | (arrays.ask_iv < 0)
+        issues.extend(_row_issues('negative_iv', ValidationSeverity.WARNING, arrays, negative,
+                                  'iv is negative.'))
+    return issues
+
+
+def check_missing_greeks(jpx, calls, puts):
+    # IVが出ているのにギリシャ指標が欠けている行
+    issues = []
+    for arrays in (calls, puts):
+        greeks_missing = np.zeros(len(arrays.iv), dtype=bool)
+        for name in GREEK_COLUMNS:
+            greeks_missing |= np.isnan(getattr(arrays, name))
+        missing = ~np.isnan(arrays.iv) & greeks_missing
+        issues.extend(_row_issues('missing_greeks', ValidationSeverity.WARNING, arrays, missing,
+                                  'greeks are missing.'))
+    return issues
+
+
+def check_put_call_parity(jpx, calls, puts):
+    # 先物オプションなので金利を無視すると C - P = F - K
+    # 気配で見て C_ask - P_bid >= F - K かつ C_bid - P_ask <= F - K となっているかを確認する
+    future_price_info = jpx.future_price_info
+    if future_price_info is None or future_price_info.price is None or len(jpx.call_option_list) == 0:
+        return []
+
+    # 先物の限月とオプションの限月が違う場合はベーシスの分ずれるのでチェックしない
+    last_trading_day = jpx.call_option_list[0].last_trading_day
+    contract_month = future_price_info.contract_month
+    if (contract_month.year, contract_month.month) != (last_trading_day.year, last_trading_day.month):
+        return []
+
+    if not np.array_equal(calls.target_price, puts.target_price):
+        # 並びが揃っていないものはstrike_monotonicで検出済み
+        return []
+
+    tolerance = app.config['VALIDATION_PARITY_TOLERANCE']
+    intrinsic = future_price_info.price - calls.target_price
+
+    with np.errstate(invalid='ignore'):
+        too_low = (calls.ask - puts.bid) < (intrinsic - tolerance)
+        too_high = (calls.bid - puts.ask) > (intrinsic + tolerance)
+
+    return _row_issues('put_call_parity', ValidationSeverity.WARNING, calls, too_low | too_high,
+                       'quotes violate put-call parity against future price ' + str(future_price_info.price) + '.')
+
+
+def _butterfly_violation(target_price, bid, ask, tolerance):
+    # 隣り合う3つの権利行使価格で、両端を売気配で買い中央を買気配で売るバタフライが
+    # 受取超過(=裁定機会)になっているかを見る。プット・コール・パリティと同じく気配で判定する。
+    # 両端になれるのは売気配の有る行だけで、中央に買気配が無ければ違反としない。
+    valid = np.flatnonzero(~np.isnan(ask))
+    violation = np.zeros(len(ask), dtype=bool)
+    if len(valid) < 3:
+        return violation
+
+    k = target_price[valid]
+    wing = ask[valid]
+    body = bid[valid]
+    # 権利行使価格が重複している場合(strike_monotonicで検出済み)はNaNになり違反としない
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = (k[2:] - k[1:-1]) / (k[2:] - k[:-2])
+        cost = weight * wing[:-2] + (1 - weight) * wing[2:] - body[1:-1]
+        violation[valid[1:-1]] = cost < -tolerance
+
+    return violation
+
+
+def check_butterfly(jpx, calls, puts):
+    tolerance = app.config['VALIDATION_BUTTERFLY_TOLERANCE']
+    issues = []
+    for arrays in (calls, puts):
+        violation = _butterfly_violation(arrays.target_price, arrays.bid, arrays.ask, tolerance)
+        issues.extend(_row_issues('butterfly', ValidationSeverity.WARNING, arrays, violation,
+                                  'butterfly can be bought for a credit at the quotes.'))
+    return issues
+
+
+# 実行するチェックの一覧。上から順に実行する。
+CHECKS = OrderedDict((
+    ('atm_count', check_atm_count),
+    ('strike_monotonic', check_strike_monotonic),
+    ('crossed_quote', check_crossed_quote),
+    ('negative_iv', check_negative_iv),
+    ('missing_greeks', check_missing_greeks),
+    ('put_call_parity', check_put_call_parity),
+    ('butterfly', check_butterfly),
+))
+
+
+def validate_jpx(jpx):
+    check_costs = OrderedDict()
+
+    start = time.perf_counter()
+    calls = to_arrays(OptionType.CALL, jpx.call_option_list)
+    puts = to_arrays(OptionType.PUT, jpx.put_option_list)
+    check_costs['to_arrays'] = time.perf_counter() - start
+
+    issues = []
+    for check_name, check in CHECKS.items():
+        start = time.perf_counter()
+        issues.extend(check(jpx, calls, puts))
+        check_costs[check_name] = time.perf_counter() - start
+
+    is_quarantined = any(issue.severity == ValidationSeverity.ERROR for issue in issues)
+
+    log.debug('validation cost(ms): %s',
+              ', '.join('{}={:.3f}'.format(name, cost * 1000) for name, cost in check_costs.items()))
+
+    for issue in issues:
+        log.debug('validation issue: %s', issue)
+
+    return ValidationResult(issues, check_costs, is_quarantined)
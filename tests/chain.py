@@ -0,0 +1,43 @@
+"""
+テスト用に合成したオプションチェーンを作るためのモジュールです。
+"""
+from datetime import datetime
+
+from jpx_loader import JpxOptionPriceInfo, TZ_JST
+from webapp.models import Option, OptionType, FuturePriceInfo, SpotPriceInfo
+
+UPDATED_AT = TZ_JST.localize(datetime(2019, 5, 10, 15, 15))
+LAST_TRADING_DAY = TZ_JST.localize(datetime(2019, 6, 13))
+CONTRACT_MONTH = TZ_JST.localize(datetime(2019, 6, 1))
+
+FUTURE_PRICE = 21000
+TARGET_PRICES = [20000, 20500, 21000, 21500, 22000]
+
+
+def make_option(option_type, target_price, is_atm=False, bid=None, ask=None, iv=20.0, bid_iv=None, ask_iv=None,
+                volume=None, positions=None, delta=0.5, gamma=0.0001, theta=-5.0, vega=20.0,
+                last_trading_day=LAST_TRADING_DAY, updated_at=UPDATED_AT):
+    return Option(None, option_type, target_price, is_atm, None, None, None, None, iv, bid, None, bid_iv, ask, None,
+                  ask_iv, volume, positions, None, None, delta, gamma, theta, vega, last_trading_day, updated_at)
+
+
+def time_value(target_price):
+    # ATMで最大になるテント型の時間価値
+    return 200 - 0.2 * abs(target_price - FUTURE_PRICE)
+
+
+def make_chain(future_price=FUTURE_PRICE, contract_month=CONTRACT_MONTH, spread=5):
+    # C - P = F - K を満たし、権利行使価格に対して凸な価格のチェーン
+    call_option_list = []
+    put_option_list = []
+    for k in TARGET_PRICES:
+        call_mid = max(FUTURE_PRICE - k, 0) + time_value(k)
+        put_mid = max(k - FUTURE_PRICE, 0) + time_value(k)
+        is_atm = k == FUTURE_PRICE
+        call_option_list.append(make_option(OptionType.CALL, k, is_atm, call_mid - spread, call_mid + spread))
+        put_option_list.append(make_option(OptionType.PUT, k, is_atm, put_mid - spread, put_mid + spread))
+
+    spot_price_info = SpotPriceInfo(None, 20950.0, UPDATED_AT, None, None, None, UPDATED_AT)
+    future_price_info = FuturePriceInfo(None, future_price, UPDATED_AT, None, None, None, contract_month, UPDATED_AT)
+
+    return JpxOptionPriceInfo(spot_price_info, future_price_info, call_option_list, put_option_list, UPDATED_AT)
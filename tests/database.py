@@ -0,0 +1,33 @@
+"""
+一時ディレクトリのSQLiteファイルを使うテストのためのモジュールです。
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from webapp import app, db
+
+
+class DatabaseTestCase(unittest.TestCase):
+    # テストごとに空のDBを作り、終わったら設定を元に戻してディレクトリごと消す
+
+    CONFIG_KEYS = ('SQLALCHEMY_DATABASE_URI', 'ARCHIVE_DIR', 'QUARANTINE_DIR', 'RETENTION_CHUNK_INTERVAL')
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.__config = {key: app.config[key] for key in self.CONFIG_KEYS}
+
+        app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(self.temp_dir, 'option.db'),
+            ARCHIVE_DIR=os.path.join(self.temp_dir, 'archive'),
+            QUARANTINE_DIR=os.path.join(self.temp_dir, 'quarantine'),
+            RETENTION_CHUNK_INTERVAL=0,
+        )
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        app.config.update(self.__config)
+        shutil.rmtree(self.temp_dir)
@@ -0,0 +1,112 @@
+import unittest
+from datetime import timedelta
+
+import numpy as np
+
+import jpx_analytics
+import jpx_validator
+from tests.chain import make_chain, make_option, UPDATED_AT, LAST_TRADING_DAY
+from tests.database import DatabaseTestCase
+from webapp import db
+from webapp.models import OptionType
+
+
+def arrays(option_type, target_prices, positions=None, delta=None, iv=None):
+    options = []
+    for i, k in enumerate(target_prices):
+        options.append(make_option(option_type, k,
+                                   positions=positions[i] if positions is not None else None,
+                                   delta=delta[i] if delta is not None else None,
+                                   iv=iv[i] if iv is not None else None))
+    return jpx_validator.to_arrays(option_type, options)
+
+
+class MaxPainTest(unittest.TestCase):
+
+    def test_hand_computed_chain(self):
+        # 満期の価格Sごとの買い手の受取総額
+        #  S=100: CALL 0,                        PUT (200-100)*10 + (300-100)*5 = 2000
+        #  S=200: CALL (200-100)*50 = 5000,      PUT (300-200)*5 = 500
+        #  S=300: CALL 200*50 + 100*10 = 11000,  PUT 0
+        calls = arrays(OptionType.CALL, [100, 200, 300], positions=[50, 10, 20])
+        puts = arrays(OptionType.PUT, [100, 200, 300], positions=[20, 10, 5])
+
+        self.assertEqual(100, jpx_analytics.max_pain(calls, puts))
+
+    def test_missing_positions(self):
+        calls = arrays(OptionType.CALL, [100, 200, 300], positions=[None, 10, None])
+        puts = arrays(OptionType.PUT, [100, 200, 300], positions=[None, None, 30])
+
+        # S=100: PUT 200*30 = 6000, S=200: PUT 100*30 = 3000, S=300: CALL 100*10 = 1000
+        self.assertEqual(300, jpx_analytics.max_pain(calls, puts))
+
+    def test_no_positions(self):
+        calls = arrays(OptionType.CALL, [100, 200])
+        puts = arrays(OptionType.PUT, [100, 200])
+
+        self.assertIsNone(jpx_analytics.max_pain(calls, puts))
+
+
+class IvAtDeltaTest(unittest.TestCase):
+
+    def test_interpolate(self):
+        calls = arrays(OptionType.CALL, [100, 200, 300], delta=[0.7, 0.5, 0.2], iv=[22.0, 20.0, 17.0])
+
+        self.assertAlmostEqual(17.5, jpx_analytics.iv_at_delta(calls, 0.25))
+
+    def test_put_delta(self):
+        puts = arrays(OptionType.PUT, [100, 200, 300], delta=[-0.1, -0.3, -0.5], iv=[26.0, 23.0, 20.0])
+
+        self.assertAlmostEqual(23.75, jpx_analytics.iv_at_delta(puts, -0.25))
+
+    def test_out_of_range(self):
+        calls = arrays(OptionType.CALL, [100, 200], delta=[0.7, 0.5], iv=[22.0, 20.0])
+
+        self.assertTrue(np.isnan(jpx_analytics.iv_at_delta(calls, 0.25)))
+
+
+class ComputeAnalyticsTest(unittest.TestCase):
+
+    def test_compute_jpx_analytics(self):
+        jpx = make_chain()
+        for o, volume, positions in zip(jpx.call_option_list, [1, 2, 3, 4, 5], [10, 20, 30, 40, 50]):
+            o.volume = volume
+            o.positions = positions
+        for o, volume, positions in zip(jpx.put_option_list, [3, 3, 3, 3, 3], [5, 5, 5, 5, None]):
+            o.volume = volume
+            o.positions = positions
+
+        analytics = jpx_analytics.compute_jpx_analytics(jpx)
+
+        self.assertEqual(21000, analytics.atm_target_price)
+        self.assertAlmostEqual(20.0, analytics.atm_iv)
+        self.assertEqual(15, analytics.call_volume)
+        self.assertEqual(15, analytics.put_volume)
+        self.assertAlmostEqual(1.0, analytics.put_call_volume_ratio)
+        self.assertEqual(150, analytics.call_positions)
+        self.assertEqual(20, analytics.put_positions)
+        self.assertAlmostEqual(20 / 150, analytics.put_call_positions_ratio)
+        # 全行のデルタが0.5なので25デルタは範囲外
+        self.assertIsNone(analytics.skew_25d)
+        self.assertEqual(UPDATED_AT, analytics.updated_at)
+
+
+class GetAnalyticsTest(DatabaseTestCase):
+
+    def test_latest_before(self):
+        for hours in (0, 1, 2):
+            jpx = make_chain()
+            analytics = jpx_analytics.compute_jpx_analytics(jpx)
+            analytics.updated_at = UPDATED_AT + timedelta(hours=hours)
+            db.session.add(analytics)
+        db.session.commit()
+
+        # 取引最終日はjpx_loaderと同じdatetimeでもdateでもよい
+        self.assertEqual(UPDATED_AT + timedelta(hours=2), jpx_analytics.get_analytics(LAST_TRADING_DAY).updated_at)
+        analytics = jpx_analytics.get_analytics(LAST_TRADING_DAY.date(), UPDATED_AT + timedelta(hours=1, minutes=30))
+        self.assertEqual(UPDATED_AT + timedelta(hours=1), analytics.updated_at)
+        self.assertIsNone(jpx_analytics.get_analytics(LAST_TRADING_DAY, UPDATED_AT - timedelta(minutes=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import threading
+import unittest
+from unittest import mock
+
+import jpx_collector
+import jpx_loader
+from jpx_loader import JpxSource
+
+
+def stub_source(name, parser=None, min_interval=0, is_primary=False):
+    # load_html_from_web をURLを返すように差し替えるので、パーサにはURLがそのまま渡る
+    return JpxSource(name, 'https://example.com/' + name, parser or (lambda html: html), min_interval, is_primary)
+
+
+class CollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(jpx_loader, 'load_html_from_web', side_effect=lambda url, session=None: url)
+        self.load_html_from_web = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def collector(self, sources, max_workers=jpx_collector.DEFAULT_MAX_WORKERS):
+        collector = jpx_collector.Collector(sources, max_workers)
+        self.addCleanup(collector.close)
+        return collector
+
+    def test_primary_and_secondary_sources(self):
+        first = stub_source('first', is_primary=True)
+        second = stub_source('second')
+        collector = self.collector([first, second])
+
+        self.assertEqual([first], collector.primary_sources)
+        self.assertEqual([second], collector.secondary_sources)
+
+    def test_fetch_uses_shared_session(self):
+        source = stub_source('first')
+        collector = self.collector([source])
+
+        self.assertEqual(source.url, collector.fetch(source))
+        self.load_html_from_web.assert_called_once_with(source.url, collector.session)
+
+    def test_rate_limit_per_source(self):
+        slow = stub_source('slow', min_interval=30)
+        other = stub_source('other', min_interval=30)
+        collector = self.collector([slow, other])
+
+        # 時刻は進まないものとして、予約された取得時刻までの待ち時間だけを見る
+        with mock.patch.object(jpx_collector.time, 'monotonic', return_value=1000.0), \
+                mock.patch.object(jpx_collector.time, 'sleep') as sleep:
+            collector.fetch(slow)
+            collector.fetch(slow)
+            collector.fetch(other)
+            collector.fetch(slow)
+
+        self.assertEqual([mock.call(30.0), mock.call(60.0)], sleep.call_args_list)
+
+    def test_rate_limit_after_interval(self):
+        source = stub_source('first', min_interval=30)
+        collector = self.collector([source])
+
+        with mock.patch.object(jpx_collector.time, 'monotonic', side_effect=[1000.0, 1000.0, 1040.0, 1040.0]), \
+                mock.patch.object(jpx_collector.time, 'sleep') as sleep:
+            collector.fetch(source)
+            collector.fetch(source)
+
+        sleep.assert_not_called()
+
+    def test_fetch_all_keeps_order(self):
+        finished = threading.Event()
+
+        def wait_for_fast(html):
+            # 後ろのページの取得が終わるまで待つので、完了順は逆になる
+            self.assertTrue(finished.wait(5))
+            return html
+
+        def fast(html):
+            finished.set()
+            return html
+
+        sources = [stub_source('slow', wait_for_fast), stub_source('fast', fast)]
+        results = self.collector(sources, max_workers=2).fetch_all(sources)
+
+        self.assertEqual(sources, [r.source for r in results])
+        self.assertEqual([s.url for s in sources], [r.jpx for r in results])
+        self.assertEqual([None, None], [r.error for r in results])
+
+    def test_fetch_all_captures_error(self):
+        def broken(html):
+            raise ValueError('unexpected html')
+
+        sources = [stub_source('first'), stub_source('broken', broken), stub_source('third')]
+        results = self.collector(sources).fetch_all(sources)
+
+        self.assertEqual([sources[0].url, None, sources[2].url], [r.jpx for r in results])
+        self.assertIsNone(results[0].error)
+        self.assertIs(ValueError, results[1].error[0])
+        self.assertEqual('unexpected html', str(results[1].error[1]))
+        self.assertIsNone(results[2].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from datetime import datetime, date
+
+import numpy as np
+
+import jpx_history
+from tests.chain import make_option, TZ_JST
+from tests.database import DatabaseTestCase
+from webapp import db
+from webapp.models import Option, OptionType
+
+FIRST = TZ_JST.localize(datetime(2019, 5, 10, 15, 0))
+SECOND = TZ_JST.localize(datetime(2019, 5, 10, 15, 15))
+JUNE = TZ_JST.localize(datetime(2019, 6, 13))
+JULY = TZ_JST.localize(datetime(2019, 7, 11))
+
+
+class HistoryTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        # わざと並び順とは違う順番で入れる
+        options = [
+            make_option(OptionType.PUT, 21000, True, bid=95, ask=105, last_trading_day=JUNE, updated_at=SECOND),
+            make_option(OptionType.CALL, 21500, last_trading_day=JULY, updated_at=FIRST),
+            make_option(OptionType.CALL, 21000, True, bid=190, ask=210, volume=3, last_trading_day=JUNE,
+                        updated_at=SECOND),
+            make_option(OptionType.PUT, 20500, iv=None, delta=None, last_trading_day=JUNE, updated_at=FIRST),
+            make_option(OptionType.CALL, 20500, last_trading_day=JUNE, updated_at=FIRST),
+        ]
+        options[2].price_time = TZ_JST.localize(datetime(2019, 5, 10, 15, 10))
+        options[2].quotation_date = TZ_JST.localize(datetime(2019, 5, 9))
+        db.session.add_all(options)
+        db.session.commit()
+
+        self.expected = db.session.query(Option)\
+            .order_by(Option.updated_at, Option.last_trading_day, Option.type, Option.target_price).all()
+
+    def test_order(self):
+        rows = list(jpx_history.iter_option_rows())
+
+        self.assertEqual([(FIRST, date(2019, 6, 13), OptionType.CALL, 20500),
+                          (FIRST, date(2019, 6, 13), OptionType.PUT, 20500),
+                          (FIRST, date(2019, 7, 11), OptionType.CALL, 21500),
+                          (SECOND, date(2019, 6, 13), OptionType.CALL, 21000),
+                          (SECOND, date(2019, 6, 13), OptionType.PUT, 21000)],
+                         [(o.updated_at, o.last_trading_day, o.type, o.target_price) for o in rows])
+
+    def test_rows_equal_orm_values(self):
+        rows = list(jpx_history.iter_option_rows(chunk_size=2))
+
+        self.assertEqual(len(self.expected), len(rows))
+        for option, row in zip(self.expected, rows):
+            self.assertEqual([getattr(option, name) for name in jpx_history.OPTION_COLUMNS], list(row))
+
+        row = rows[3]
+        self.assertEqual(TZ_JST.zone, row.updated_at.tzinfo.zone)
+        self.assertEqual(TZ_JST.localize(datetime(2019, 5, 10, 15, 10)), row.price_time)
+        self.assertIs(date, type(row.last_trading_day))
+        self.assertEqual(date(2019, 5, 9), row.quotation_date)
+        self.assertIs(OptionType.CALL, row.type)
+        self.assertIs(True, row.is_atm)
+        self.assertIs(False, rows[0].is_atm)
+
+    def test_filter(self):
+        rows = list(jpx_history.iter_option_rows(since=SECOND))
+        self.assertEqual([SECOND, SECOND], [o.updated_at for o in rows])
+
+        # 取引最終日はjpx_loaderと同じdatetimeでもdateでもよい
+        rows = list(jpx_history.iter_option_rows(until=SECOND, last_trading_day=JUNE))
+        self.assertEqual([20500, 20500], [o.target_price for o in rows])
+
+        rows = list(jpx_history.iter_option_rows(last_trading_day=JULY.date()))
+        self.assertEqual([21500], [o.target_price for o in rows])
+
+    def test_batches_split_by_chunk_size(self):
+        batches = list(jpx_history.iter_option_batches(chunk_size=2))
+
+        self.assertEqual([2, 2, 1], [len(batch['target_price']) for batch in batches])
+        self.assertEqual([20500, 20500, 21500, 21000, 21000],
+                         list(np.concatenate([batch['target_price'] for batch in batches])))
+        self.assertEqual(list(jpx_history.OPTION_COLUMNS), list(batches[0].keys()))
+
+    def test_batch_dtypes(self):
+        batch, = jpx_history.iter_option_batches()
+
+        self.assertEqual(np.dtype('datetime64[s]'), batch['updated_at'].dtype)
+        self.assertEqual(np.dtype('datetime64[D]'), batch['last_trading_day'].dtype)
+        self.assertEqual(np.dtype(bool), batch['is_atm'].dtype)
+        self.assertEqual(np.dtype(np.int64), batch['type'].dtype)
+        self.assertEqual(np.dtype(np.int64), batch['target_price'].dtype)
+        self.assertEqual(np.dtype(float), batch['bid'].dtype)
+
+        # 日時はUTCのdatetime64、欠損値はNaTやNaN
+        self.assertEqual(np.datetime64(int(FIRST.timestamp()), 's'), batch['updated_at'][0])
+        self.assertEqual(np.datetime64('2019-06-13'), batch['last_trading_day'][0])
+        self.assertEqual([True, True, True, False, True], list(np.isnat(batch['price_time'])))
+        self.assertEqual(np.datetime64('2019-05-09'), batch['quotation_date'][3])
+        self.assertTrue(np.isnat(batch['quotation_date'][0]))
+        self.assertEqual([False, True, False, False, False], list(np.isnan(batch['iv'])))
+        self.assertEqual([True, True, True, False, False], list(np.isnan(batch['bid'])))
+        self.assertEqual([OptionType.CALL.value, OptionType.PUT.value], list(batch['type'][:2]))
+
+    def test_columns(self):
+        batch, = jpx_history.iter_option_batches(columns=('updated_at', 'iv'))
+
+        self.assertEqual(['updated_at', 'iv'], list(batch.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import jpx_collector
+import jpx_importer
+import jpx_loader
+from jpx_loader import JpxSource
+from tests.chain import make_chain, TZ_JST, LAST_TRADING_DAY
+from tests.database import DatabaseTestCase
+from webapp import db
+from webapp.models import Option, FuturePriceInfo, OptionAnalytics
+
+NEXT_LAST_TRADING_DAY = TZ_JST.localize(datetime(2019, 7, 11))
+
+
+def next_month_chain(html):
+    jpx = make_chain()
+    for o in jpx.call_option_list + jpx.put_option_list:
+        o.last_trading_day = NEXT_LAST_TRADING_DAY
+    return jpx
+
+
+def broken(html):
+    raise ValueError('unexpected html')
+
+
+class DoImportTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        patcher = mock.patch.object(jpx_loader, 'load_html_from_web', return_value='<html></html>')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def collector(self, secondary_parsers):
+        sources = [JpxSource('primary', 'https://example.com/0', lambda html: make_chain(), 0, True)]
+        sources.extend(JpxSource('secondary{}'.format(i), 'https://example.com/{}'.format(i), parser, 0, False)
+                       for i, parser in enumerate(secondary_parsers, 1))
+
+        collector = jpx_collector.Collector(sources)
+        self.addCleanup(collector.close)
+        return collector
+
+    def saved_last_trading_days(self):
+        q = db.session.query(Option.last_trading_day).distinct().order_by(Option.last_trading_day)
+        return [row.last_trading_day for row in q]
+
+    def test_failing_secondary_source(self):
+        collector = self.collector([broken, next_month_chain])
+
+        with self.assertLogs('jpx_importer', 'WARNING'):
+            jpx_importer.do_import(None, collector)
+
+        db.session.remove()
+        # 次限月の取得に失敗しても、期近とその他のページは保存してコミットされる
+        self.assertEqual([LAST_TRADING_DAY.date(), NEXT_LAST_TRADING_DAY.date()], self.saved_last_trading_days())
+        self.assertEqual(1, db.session.query(FuturePriceInfo).count())
+        self.assertEqual(2, db.session.query(OptionAnalytics).count())
+
+    def test_failing_primary_source(self):
+        collector = self.collector([next_month_chain])
+        collector.sources[0] = collector.sources[0]._replace(parser=broken)
+
+        with self.assertRaises(ValueError):
+            jpx_importer.do_import(None, collector)
+
+        db.session.rollback()
+        self.assertEqual([], self.saved_last_trading_days())
+
+    def test_not_updated(self):
+        jpx_importer.do_import(None, self.collector([]))
+
+        # 同じ更新時刻のページしか無ければ期近以外のページは取得しない
+        collector = self.collector([broken])
+        with mock.patch.object(collector, 'fetch_all', wraps=collector.fetch_all) as fetch_all:
+            jpx_importer.do_import(None, collector)
+
+        fetch_all.assert_called_once_with(collector.primary_sources)
+        self.assertEqual([LAST_TRADING_DAY.date()], self.saved_last_trading_days())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import jpx_replay
+from tests.chain import make_option, TZ_JST
+from tests.database import DatabaseTestCase
+from webapp import db
+from webapp.models import OptionType, FuturePriceInfo, SpotPriceInfo
+
+FIRST = TZ_JST.localize(datetime(2019, 5, 10, 15, 0))
+SECOND = FIRST + timedelta(minutes=15)
+THIRD = FIRST + timedelta(minutes=45)
+JUNE = TZ_JST.localize(datetime(2019, 6, 13))
+JULY = TZ_JST.localize(datetime(2019, 7, 11))
+
+
+def add_options(updated_at, last_trading_day):
+    for k in (20500, 21000):
+        for option_type in (OptionType.CALL, OptionType.PUT):
+            db.session.add(make_option(option_type, k, k == 21000, last_trading_day=last_trading_day,
+                                       updated_at=updated_at))
+
+
+def add_price_info(updated_at, future_price):
+    db.session.add(SpotPriceInfo(None, 20950.0, updated_at, None, None, None, updated_at))
+    db.session.add(FuturePriceInfo(None, future_price, updated_at, None, None, None, JUNE, updated_at))
+
+
+class ReplayTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        add_options(FIRST, JUNE)
+        add_options(FIRST, JULY)
+        add_options(SECOND, JUNE)
+        add_options(THIRD, JUNE)
+        add_price_info(FIRST, 21000)
+        # SECOND の先物＆現物価格は保持ポリシーで削除されたものとする
+        add_price_info(THIRD, 21100)
+        db.session.commit()
+
+    def test_iter_snapshots(self):
+        snapshots = list(jpx_replay.iter_snapshots(chunk_size=3))
+
+        self.assertEqual([(FIRST, JUNE.date()), (FIRST, JULY.date()), (SECOND, JUNE.date()), (THIRD, JUNE.date())],
+                         [(jpx.updated_at, jpx.call_option_list[0].last_trading_day) for jpx in snapshots])
+
+        for jpx in snapshots:
+            self.assertEqual([(OptionType.CALL, 20500), (OptionType.CALL, 21000)],
+                             [(o.type, o.target_price) for o in jpx.call_option_list])
+            self.assertEqual([(OptionType.PUT, 20500), (OptionType.PUT, 21000)],
+                             [(o.type, o.target_price) for o in jpx.put_option_list])
+
+        # 同じ時刻の限月には同じ先物＆現物価格が付く
+        self.assertEqual([21000, 21000, None, 21100],
+                         [jpx.future_price_info.price if jpx.future_price_info else None for jpx in snapshots])
+        self.assertEqual([FIRST, FIRST, None, THIRD],
+                         [jpx.spot_price_info.updated_at if jpx.spot_price_info else None for jpx in snapshots])
+
+    def test_iter_snapshots_period(self):
+        snapshots = list(jpx_replay.iter_snapshots(since=SECOND, until=THIRD))
+
+        self.assertEqual([SECOND], [jpx.updated_at for jpx in snapshots])
+        self.assertIsNone(snapshots[0].future_price_info)
+
+    def test_replay_as_fast_as_possible(self):
+        handler = mock.Mock()
+
+        with mock.patch.object(jpx_replay.time, 'sleep') as sleep:
+            stats = jpx_replay.replay(handler)
+
+        self.assertEqual(4, stats.events)
+        self.assertEqual(4, handler.call_count)
+        sleep.assert_not_called()
+
+    def test_replay_speed(self):
+        handler = mock.Mock()
+
+        # 処理時間は掛からないものとして、60倍速ならスナップショットの間隔の1/60ずつ待つ
+        with mock.patch.object(jpx_replay.time, 'perf_counter', return_value=100.0), \
+                mock.patch.object(jpx_replay.time, 'sleep') as sleep:
+            jpx_replay.replay(handler, speed=60)
+
+        self.assertEqual([mock.call(15.0), mock.call(45.0)], sleep.call_args_list)
+
+    def test_replay_speed_subtracts_elapsed_time(self):
+        handler = mock.Mock()
+
+        # 開始から20秒経っていれば、その分だけ待ち時間が短くなり、遅れている場合は待たない
+        with mock.patch.object(jpx_replay.time, 'perf_counter', side_effect=[0.0, 0.0, 0.0, 20.0, 100.0, 100.0]), \
+                mock.patch.object(jpx_replay.time, 'sleep') as sleep:
+            jpx_replay.replay(handler, speed=30)
+
+        self.assertEqual([mock.call(10.0)], sleep.call_args_list)
+
+    def test_replay_rejects_non_positive_speed(self):
+        for speed in (0, -1.0):
+            with self.assertRaises(ValueError):
+                jpx_replay.replay(mock.Mock(), speed=speed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import csv
+import gzip
+import os
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from pytz import utc
+
+import jpx_retention
+from tests.chain import make_option, TZ_JST
+from tests.database import DatabaseTestCase
+from webapp import app, db
+from webapp.models import (Option, OptionType, FuturePriceInfo, SpotPriceInfo, OptionValidationIssue,
+                           ValidationSeverity)
+
+POLICY = [(30, 15 * 60), (90, 24 * 60 * 60)]
+
+NOW = TZ_JST.localize(datetime(2019, 12, 1, 12, 0))
+
+EXPIRED = TZ_JST.localize(datetime(2019, 10, 10))
+LIVE = TZ_JST.localize(datetime(2019, 12, 12))
+
+
+def jst(*args):
+    return TZ_JST.localize(datetime(*args))
+
+
+def add_snapshot(updated_at, last_trading_days):
+    db.session.add(SpotPriceInfo(None, 21000.0, updated_at, None, None, None, updated_at))
+    db.session.add(FuturePriceInfo(None, 21000, updated_at, None, None, None, None, updated_at))
+    for last_trading_day in last_trading_days:
+        db.session.add(make_option(OptionType.CALL, 21000, True, last_trading_day=last_trading_day,
+                                   updated_at=updated_at))
+
+
+def updated_at_of(model, **filters):
+    q = db.session.query(model.updated_at).filter_by(**filters).order_by(model.updated_at)
+    return [row.updated_at for row in q]
+
+
+def read_archive(file_name):
+    with gzip.open(os.path.join(app.config['ARCHIVE_DIR'], file_name), mode='rt', encoding='UTF-8') as f:
+        return list(csv.reader(f))
+
+
+class RetentionWindowsTest(unittest.TestCase):
+
+    def test_windows(self):
+        windows = jpx_retention.retention_windows(NOW, POLICY)
+
+        # 経過日数はJSTの0時で区切る
+        self.assertEqual([
+            (int(jst(2019, 9, 2).timestamp()), int(jst(2019, 11, 1).timestamp()), 15 * 60),
+            (None, int(jst(2019, 9, 2).timestamp()), 24 * 60 * 60),
+        ], windows)
+
+    def test_day_start_in_jst(self):
+        # UTCでは前日の15:00〜でも、JSTでは同じ日になる
+        for now in (jst(2019, 12, 1, 0, 0), jst(2019, 12, 1, 23, 59), datetime(2019, 11, 30, 15, 0, tzinfo=utc)):
+            self.assertEqual(jpx_retention.retention_windows(NOW, POLICY),
+                             jpx_retention.retention_windows(now, POLICY))
+
+
+class ApplyRetentionPolicyTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        app.config['RETENTION_POLICY'], self.__policy = POLICY, app.config['RETENTION_POLICY']
+
+    def tearDown(self):
+        app.config['RETENTION_POLICY'] = self.__policy
+        super().tearDown()
+
+    def test_keep_last_snapshot_in_each_bucket(self):
+        # 15分足の区間 (2019/10/15)
+        quarter = [jst(2019, 10, 15, 9, 0), jst(2019, 10, 15, 9, 5), jst(2019, 10, 15, 9, 14),
+                   jst(2019, 10, 15, 9, 15), jst(2019, 10, 15, 9, 20)]
+        # 日足の区間 (2019/8/1)。23:30と翌0:30はUTCでは同じ日だがJSTでは別の日
+        daily = [jst(2019, 8, 1, 9, 0), jst(2019, 8, 1, 15, 15), jst(2019, 8, 1, 23, 30), jst(2019, 8, 2, 0, 30)]
+        for updated_at in quarter + daily:
+            add_snapshot(updated_at, [EXPIRED])
+        db.session.commit()
+
+        jpx_retention.apply_retention_policy(NOW)
+
+        expected = [jst(2019, 8, 1, 23, 30), jst(2019, 8, 2, 0, 30), jst(2019, 10, 15, 9, 14), jst(2019, 10, 15, 9, 20)]
+        self.assertEqual(expected, updated_at_of(Option))
+        self.assertEqual(expected, updated_at_of(FuturePriceInfo))
+        self.assertEqual(expected, updated_at_of(SpotPriceInfo))
+
+    def test_keep_live_contract_month(self):
+        snapshots = [jst(2019, 8, 1, 9, 0), jst(2019, 8, 1, 12, 0), jst(2019, 8, 1, 15, 15)]
+        for updated_at in snapshots:
+            add_snapshot(updated_at, [EXPIRED, LIVE])
+        db.session.commit()
+
+        jpx_retention.apply_retention_policy(NOW)
+
+        self.assertEqual(snapshots, updated_at_of(Option, last_trading_day=LIVE.date()))
+        self.assertEqual(snapshots[-1:], updated_at_of(Option, last_trading_day=EXPIRED.date()))
+        # まだ限月の終わっていないオプション価格から参照されているので先物＆現物価格も残す
+        self.assertEqual(snapshots, updated_at_of(FuturePriceInfo))
+        self.assertEqual(snapshots, updated_at_of(SpotPriceInfo))
+
+    def test_keep_price_info_referenced_by_option(self):
+        add_snapshot(jst(2019, 8, 1, 9, 0), [LIVE])
+        add_snapshot(jst(2019, 8, 1, 12, 0), [])
+        add_snapshot(jst(2019, 8, 1, 15, 15), [])
+        db.session.commit()
+
+        jpx_retention.apply_retention_policy(NOW)
+
+        # 9:00は参照されているので残り、15:15はその日の最後なので残る
+        self.assertEqual([jst(2019, 8, 1, 9, 0), jst(2019, 8, 1, 15, 15)], updated_at_of(FuturePriceInfo))
+        self.assertEqual([jst(2019, 8, 1, 9, 0), jst(2019, 8, 1, 15, 15)], updated_at_of(SpotPriceInfo))
+
+    def test_downsample_validation_issues(self):
+        for updated_at in (jst(2019, 10, 15, 9, 0), jst(2019, 10, 15, 9, 5), jst(2019, 11, 15, 9, 0)):
+            db.session.add(OptionValidationIssue(None, 'atm_count', ValidationSeverity.ERROR, OptionType.CALL, None,
+                                                 'ATM count is 0. expected exactly 1.', EXPIRED, updated_at))
+        db.session.commit()
+
+        jpx_retention.apply_retention_policy(NOW)
+
+        # 30日以内のものはそのまま
+        self.assertEqual([jst(2019, 10, 15, 9, 5), jst(2019, 11, 15, 9, 0)], updated_at_of(OptionValidationIssue))
+
+    def test_archive_with_coarser_pass(self):
+        last_trading_day = jst(2019, 8, 8)
+        snapshots = [jst(2019, 8, 1, 9, 0), jst(2019, 8, 1, 9, 5), jst(2019, 8, 1, 9, 20), jst(2019, 8, 1, 15, 15)]
+        for updated_at in snapshots:
+            add_snapshot(updated_at, [last_trading_day])
+        db.session.commit()
+
+        # 45日後は15分足、その後は日足で間引く
+        jpx_retention.apply_retention_policy(jst(2019, 9, 15, 12, 0))
+        self.assertEqual(snapshots[1:], updated_at_of(Option))
+
+        jpx_retention.apply_retention_policy(NOW)
+        self.assertEqual(snapshots[-1:], updated_at_of(Option))
+
+        rows = read_archive('option_20190808_20190801.csv.gz')
+        header = [c.name for c in Option.__table__.columns]
+        self.assertEqual([header], [row for row in rows if row[0] == 'id'])
+        self.assertEqual(header, rows[0])
+        self.assertEqual([str(int(t.timestamp())) for t in snapshots[:-1]],
+                         [row[header.index('updated_at')] for row in rows[1:]])
+
+        rows = read_archive('future_price_info_20190801.csv.gz')
+        self.assertEqual(4, len(rows))
+
+    def test_archive_after_crash_before_append(self):
+        snapshots = [jst(2019, 8, 1, 9, 0), jst(2019, 8, 1, 9, 20), jst(2019, 8, 1, 15, 15)]
+        for updated_at in snapshots:
+            add_snapshot(updated_at, [EXPIRED])
+        db.session.commit()
+
+        # 削除のコミット後、一時ファイルを追記する前に落ちた場合
+        with mock.patch.object(jpx_retention, '_commit_archive', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                jpx_retention.apply_retention_policy(NOW)
+
+        self.assertEqual(snapshots[-1:], updated_at_of(Option))
+        self.assertFalse(os.path.exists(os.path.join(app.config['ARCHIVE_DIR'], 'option_20191010_20190801.csv.gz')))
+
+        jpx_retention.apply_retention_policy(NOW)
+
+        rows = read_archive('option_20191010_20190801.csv.gz')
+        header = [c.name for c in Option.__table__.columns]
+        self.assertEqual([str(int(t.timestamp())) for t in snapshots[:-1]],
+                         [row[header.index('updated_at')] for row in rows[1:]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+
+import jpx_surface
+from tests.chain import make_chain, UPDATED_AT, LAST_TRADING_DAY
+
+# 既知のSVIパラメータ (a, b, rho, m, sigma)
+PARAMS = (0.002, 0.05, -0.6, 0.01, 0.08)
+
+
+def svi(k, a, b, rho, m, sigma):
+    return a + b * (rho * (k - m) + np.sqrt((k - m) ** 2 + sigma ** 2))
+
+
+def smile(time_to_expiry, forward, scale=1.0):
+    a, b, rho, m, sigma = PARAMS
+    return jpx_surface.SmileParams(None, time_to_expiry, forward, a * scale, b * scale, rho, m, sigma, 0.0, 0)
+
+
+class FitSviTest(unittest.TestCase):
+
+    def test_recovers_known_parameters(self):
+        k = np.linspace(-0.2, 0.15, 30)
+        w = svi(k, *PARAMS)
+
+        a, b, rho, m, sigma, rmse = jpx_surface.fit_svi(k, w)
+
+        np.testing.assert_allclose([a, b, rho, m, sigma], PARAMS, rtol=0.05, atol=1e-3)
+        self.assertLess(rmse, 1e-5)
+
+
+class FitSmileTest(unittest.TestCase):
+
+    def test_fit_chain(self):
+        jpx = make_chain()
+        t = jpx_surface.time_to_expiry(LAST_TRADING_DAY, UPDATED_AT)
+        for o in jpx.call_option_list + jpx.put_option_list:
+            o.iv = np.sqrt(svi(np.log(o.target_price / 21000), *PARAMS) / t) * 100
+
+        result = jpx_surface.fit_jpx(jpx)
+
+        # フォワードはプット・コール・パリティから求まる
+        self.assertAlmostEqual(21000, result.forward)
+        self.assertAlmostEqual(t, result.time_to_expiry)
+        self.assertEqual(5, result.num_points)
+        self.assertLess(result.rmse, 1e-4)
+
+    def test_too_few_points(self):
+        jpx = make_chain()
+        for o in jpx.put_option_list:
+            o.iv = None
+
+        self.assertIsNone(jpx_surface.fit_jpx(jpx))
+
+
+class VolSurfaceTest(unittest.TestCase):
+
+    def test_single_expiry(self):
+        surface = jpx_surface.VolSurface([smile(0.1, 21000)])
+        strikes = np.array([20000, 21000, 22000])
+        expected = np.sqrt(svi(np.log(strikes / 21000), *PARAMS) / 0.1) * 100
+
+        np.testing.assert_allclose(expected, surface.iv(strikes, 0.1))
+        # 満期の前後はIV一定で外挿する
+        np.testing.assert_allclose(expected, surface.iv(strikes, 0.05))
+        np.testing.assert_allclose(expected, surface.iv(strikes, 0.5))
+
+    def test_multi_expiry(self):
+        surface = jpx_surface.VolSurface([smile(0.3, 21000, scale=3.0), smile(0.1, 21000)])
+        strikes = np.array([20000, 21000, 22000])
+        w_near = svi(np.log(strikes / 21000), *PARAMS)
+        w_far = 3 * w_near
+
+        np.testing.assert_allclose(w_near, surface.total_variance(strikes, 0.1))
+        np.testing.assert_allclose(w_far, surface.total_variance(strikes, 0.3))
+        # 限月の間はトータルバリアンスを残存期間で線形補間する
+        np.testing.assert_allclose((w_near + w_far) / 2, surface.total_variance(strikes, 0.2))
+        # 範囲外はIV一定で外挿する
+        np.testing.assert_allclose(surface.iv(strikes, 0.1), surface.iv(strikes, 0.01))
+        np.testing.assert_allclose(surface.iv(strikes, 0.3), surface.iv(strikes, 1.0))
+
+    def test_forward_is_interpolated(self):
+        surface = jpx_surface.VolSurface([smile(0.1, 21000), smile(0.3, 21200)])
+
+        # 各限月のATM(k = 0)は同じトータルバリアンスになる
+        np.testing.assert_allclose(surface.total_variance(21000, 0.1), surface.total_variance(21200, 0.3))
+        np.testing.assert_allclose(surface.total_variance(21000, 0.1), surface.total_variance(21100, 0.2))
+
+    def test_broadcast(self):
+        surface = jpx_surface.VolSurface([smile(0.1, 21000), smile(0.3, 21000, scale=3.0)])
+        strikes = np.array([[20000], [21000], [22000]])
+        times = np.array([0.1, 0.2, 0.3, 0.4])
+
+        self.assertEqual((3, 4), surface.iv(strikes, times).shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+import jpx_validator
+from tests.chain import make_chain, TZ_JST
+from webapp.models import OptionType, ValidationSeverity
+
+
+def issues_of(result, check_name):
+    return [issue for issue in result.issues if issue.check_name == check_name]
+
+
+class ValidateJpxTest(unittest.TestCase):
+
+    def test_clean_chain(self):
+        result = jpx_validator.validate_jpx(make_chain())
+
+        self.assertEqual([], result.issues)
+        self.assertFalse(result.is_quarantined)
+        self.assertEqual(['to_arrays'] + list(jpx_validator.CHECKS.keys()), list(result.check_costs.keys()))
+
+    def test_atm_count(self):
+        jpx = make_chain()
+        jpx.put_option_list[0].is_atm = True
+
+        result = jpx_validator.validate_jpx(jpx)
+
+        issues = issues_of(result, 'atm_count')
+        self.assertEqual(1, len(issues))
+        self.assertEqual(OptionType.PUT, issues[0].type)
+        self.assertEqual(ValidationSeverity.ERROR, issues[0].severity)
+        self.assertTrue(result.is_quarantined)
+
+    def test_strike_monotonic(self):
+        jpx = make_chain()
+        jpx.call_option_list[3].target_price = 20500
+
+        result = jpx_validator.validate_jpx(jpx)
+
+        issues = issues_of(result, 'strike_monotonic')
+        # CALLの4行目が単調増加でないことと、CALLとPUTの並びが違うこと
+        self.assertEqual([(OptionType.CALL, 20500), (None, None)], [(i.type, i.target_price) for i in issues])
+        self.assertTrue(result.is_quarantined)
+
+    def test_strike_decreasing(self):
+        jpx = make_chain()
+        jpx.call_option_list.reverse()
+        jpx.put_option_list.reverse()
+
+        result = jpx_validator.validate_jpx(jpx)
+
+        # 高い順に並んでいても狭義単調なら正常
+        self.assertEqual([], result.issues)
+        self.assertFalse(result.is_quarantined)
+
+    def test_strike_decreasing_with_duplicate(self):
+        jpx = make_chain()
+        jpx.call_option_list.reverse()
+        jpx.put_option_list.reverse()
+        jpx.put_option_list[2].target_price = 21500
+
+        issues = issues_of(jpx_validator.validate_jpx(jpx), 'strike_monotonic')
+
+        self.assertEqual([(OptionType.PUT, 21500), (None, None)], [(i.type, i.target_price) for i in issues])
+
+    def test_crossed_quote(self):
+        jpx = make_chain()
+        jpx.call_option_list[2].bid = jpx.call_option_list[2].ask + 1
+
+        issues = issues_of(jpx_validator.validate_jpx(jpx), 'crossed_quote')
+
+        self.assertEqual([(OptionType.CALL, 21000)], [(i.type, i.target_price) for i in issues])
+
+    def test_negative_iv(self):
+        jpx = make_chain()
+        jpx.put_option_list[1].ask_iv = -1.0
+
+        result = jpx_validator.validate_jpx(jpx)
+
+        issues = issues_of(result, 'negative_iv')
+        self.assertEqual([(OptionType.PUT, 20500)], [(i.type, i.target_price) for i in issues])
+        self.assertEqual(ValidationSeverity.WARNING, issues[0].severity)
+        self.assertFalse(result.is_quarantined)
+
+    def test_missing_greeks(self):
+        jpx = make_chain()
+        jpx.call_option_list[4].vega = None
+        # IVが無い行はギリシャ指標が無くても正常
+        jpx.put_option_list[4].iv = None
+        jpx.put_option_list[4].delta = None
+
+        issues = issues_of(jpx_validator.validate_jpx(jpx), 'missing_greeks')
+
+        self.assertEqual([(OptionType.CALL, 22000)], [(i.type, i.target_price) for i in issues])
+
+    def test_put_call_parity(self):
+        jpx = make_chain(future_price=21200)
+
+        issues = issues_of(jpx_validator.validate_jpx(jpx), 'put_call_parity')
+
+        self.assertEqual(len(jpx.call_option_list), len(issues))
+
+    def test_put_call_parity_skipped_for_other_contract_month(self):
+        jpx = make_chain(future_price=21200, contract_month=TZ_JST.localize(datetime(2019, 9, 1)))
+
+        self.assertEqual([], issues_of(jpx_validator.validate_jpx(jpx), 'put_call_parity'))
+
+    def test_butterfly(self):
+        jpx = make_chain()
+        jpx.put_option_list[2].bid += 300
+        jpx.put_option_list[2].ask += 300
+
+        issues = issues_of(jpx_validator.validate_jpx(jpx), 'butterfly')
+
+        self.assertEqual([(OptionType.PUT, 21000)], [(i.type, i.target_price) for i in issues])
+
+    def test_butterfly_wide_quotes(self):
+        # 仲値(55/40/2)は凸でないが、両端を売気配で買い中央を買気配で売ると 63 - 40 = 23 の支払いになるので裁定ではない
+        target_price = np.array([100, 200, 300], dtype=float)
+        bid = np.array([50, 20, 1], dtype=float)
+        ask = np.array([60, 60, 3], dtype=float)
+
+        violation = jpx_validator._butterfly_violation(target_price, bid, ask, 5)
+
+        self.assertFalse(violation.any())
+
+    def test_butterfly_missing_quotes(self):
+        # 売気配の無い行は飛ばして両隣で判定し、中央に買気配が無ければ違反としない
+        target_price = np.array([100, 200, 300, 400], dtype=float)
+        bid = np.array([45, np.nan, 40, 1], dtype=float)
+        ask = np.array([50, np.nan, np.nan, 3], dtype=float)
+        self.assertFalse(jpx_validator._butterfly_violation(target_price, bid, ask, 5).any())
+
+        ask[2] = 41
+        # 50 * 1/3 + 3 * 2/3 - 40 = -21.3
+        self.assertEqual([False, False, True, False],
+                         list(jpx_validator._butterfly_violation(target_price, bid, ask, 5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
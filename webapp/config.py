@@ -26,4 +26,31 @@ CSRF_ENABLED     = True
 CSRF_SESSION_KEY = "secret"
 
 # Secret key for signing cookies
-SECRET_KEY = "secret"
\ No newline at end of file
+SECRET_KEY = "secret"
+
+# 検証でERRORとなったスナップショットの退避先
+QUARANTINE_DIR = os.path.join(BASE_DIR, '../data/quarantine')
+
+# プット・コール・パリティの許容誤差(円)
+VALIDATION_PARITY_TOLERANCE = 50
+
+# バタフライ(気配で組んだバタフライが受取超過になっていないか)チェックの許容誤差(円)
+VALIDATION_BUTTERFLY_TOLERANCE = 5
+
+# 古いスナップショットの保持ポリシー
+# (経過日数, 解像度(秒)) を経過日数の昇順で並べる。
+# 30日までは全件、30日を過ぎたら15分足、90日を過ぎたら日足(JSTの1日で最後のスナップショット)だけを残す。
+RETENTION_POLICY = [
+    (30, 15 * 60),
+    (90, 24 * 60 * 60),
+]
+
+# 保持ポリシーで削除したレコードの退避先
+ARCHIVE_DIR = os.path.join(BASE_DIR, '../data/archive')
+
+# 1チャンク(1日分)処理するごとに解放するページ数と待ち時間(秒)
+RETENTION_VACUUM_PAGES = 1000
+RETENTION_CHUNK_INTERVAL = 0.5
+
+# ボラティリティ・サーフェスをメモリ上に保持しておくスナップショット数
+SURFACE_CACHE_SIZE = 128
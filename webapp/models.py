@@ -168,4 +168,130 @@ class Option(db.Model):
 
     def __repr__(self):
         return '{}(id={}, type={}, target_price={}, is_atm={}, price={}, price_time={}, diff={}, diff_rate={}, iv={}, bid={}, bid_volume={}, bid_iv={}, ask={}, ask_volume={}, ask_iv={}, volume={}, positions={}, quotation={}, quotation_date={}, delta={}, gamma={}, theta={}, vega={}, last_trading_day={}, updated_at={})'\
-            .format(self.__class__.__name__, self.id, self.type, self.target_price, self.is_atm, self.price, self.price_time, self.diff, self.diff_rate, self.iv, self.bid, self.bid_volume, self.bid_iv, self.ask, self.ask_volume, self.ask_iv, self.volume, self.positions, self.quotation, self.quotation_date, self.delta, self.gamma, self.theta, self.vega, self.last_trading_day, self.updated_at)
\ No newline at end of file
+            .format(self.__class__.__name__, self.id, self.type, self.target_price, self.is_atm, self.price, self.price_time, self.diff, self.diff_rate, self.iv, self.bid, self.bid_volume, self.bid_iv, self.ask, self.ask_volume, self.ask_iv, self.volume, self.positions, self.quotation, self.quotation_date, self.delta, self.gamma, self.theta, self.vega, self.last_trading_day, self.updated_at)
+
+
+class ValidationSeverity(Enum):
+    WARNING = 1
+    ERROR = 2
+
+
+#
+# パース結果の検証で見つかった問題を記録するテーブル。
+# ERRORを含むスナップショットはoptionテーブルには保存されず隔離される。
+#
+class OptionValidationIssue(db.Model):
+    __tablename__ = 'option_validation_issue'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    check_name = db.Column(db.String(64), nullable=False)
+    severity = db.Column(EnumType(enum_class=ValidationSeverity), nullable=False)
+    type = db.Column(EnumType(enum_class=OptionType))
+    target_price = db.Column(db.Integer)
+    message = db.Column(db.String(256))
+    last_trading_day = db.Column(db.Date)
+    updated_at = db.Column(AwareDateTime, index=True, nullable=False)
+
+    def __init__(self, id, check_name, severity, type, target_price, message, last_trading_day, updated_at):
+        self.id = id
+        self.check_name = check_name
+        self.severity = severity
+        self.type = type
+        self.target_price = target_price
+        self.message = message
+        self.last_trading_day = last_trading_day
+        self.updated_at = updated_at
+
+    def __repr__(self):
+        return '{}(id={}, check_name={}, severity={}, type={}, target_price={}, message={}, last_trading_day={}, updated_at={})'\
+            .format(self.__class__.__name__, self.id, self.check_name, self.severity, self.type, self.target_price, self.message, self.last_trading_day, self.updated_at)
+
+
+#
+# 限月ごとにフィットしたSVIのパラメータ。スナップショット(updated_at)ごとのキャッシュとして使う。
+# w(k) = a + b * (rho * (k - m) + sqrt((k - m)^2 + sigma^2))
+# w: トータルバリアンス(IV^2 * 残存年数)、k: log(権利行使価格 / フォワード)
+#
+class VolSmileParam(db.Model):
+    __tablename__ = 'vol_smile_param'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    last_trading_day = db.Column(db.Date, nullable=False)
+    time_to_expiry = db.Column(db.Float, nullable=False)
+    forward = db.Column(db.Float, nullable=False)
+    a = db.Column(db.Float, nullable=False)
+    b = db.Column(db.Float, nullable=False)
+    rho = db.Column(db.Float, nullable=False)
+    m = db.Column(db.Float, nullable=False)
+    sigma = db.Column(db.Float, nullable=False)
+    rmse = db.Column(db.Float)
+    num_points = db.Column(db.Integer)
+    updated_at = db.Column(AwareDateTime, index=True, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('last_trading_day', 'updated_at', name='unique_idx_vol_smile_param'),
+    )
+
+    def __init__(self, id, last_trading_day, time_to_expiry, forward, a, b, rho, m, sigma, rmse, num_points, updated_at):
+        self.id = id
+        self.last_trading_day = last_trading_day
+        self.time_to_expiry = time_to_expiry
+        self.forward = forward
+        self.a = a
+        self.b = b
+        self.rho = rho
+        self.m = m
+        self.sigma = sigma
+        self.rmse = rmse
+        self.num_points = num_points
+        self.updated_at = updated_at
+
+    def __repr__(self):
+        return '{}(id={}, last_trading_day={}, time_to_expiry={}, forward={}, a={}, b={}, rho={}, m={}, sigma={}, rmse={}, num_points={}, updated_at={})'\
+            .format(self.__class__.__name__, self.id, self.last_trading_day, self.time_to_expiry, self.forward, self.a, self.b, self.rho, self.m, self.sigma, self.rmse, self.num_points, self.updated_at)
+
+
+#
+# スナップショット(updated_at)・限月ごとに集計済みの指標。
+# ダッシュボードからはオプション価格を全行走査せずにこのテーブルの1行を引く。
+#
+class OptionAnalytics(db.Model):
+    __tablename__ = 'option_analytics'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    last_trading_day = db.Column(db.Date, nullable=False)
+    atm_target_price = db.Column(db.Integer)
+    atm_iv = db.Column(db.Float)
+    call_iv_25d = db.Column(db.Float)
+    put_iv_25d = db.Column(db.Float)
+    skew_25d = db.Column(db.Float)
+    call_volume = db.Column(db.Integer)
+    put_volume = db.Column(db.Integer)
+    put_call_volume_ratio = db.Column(db.Float)
+    call_positions = db.Column(db.Integer)
+    put_positions = db.Column(db.Integer)
+    put_call_positions_ratio = db.Column(db.Float)
+    max_pain = db.Column(db.Integer)
+    updated_at = db.Column(AwareDateTime, index=True, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('last_trading_day', 'updated_at', name='unique_idx_option_analytics'),
+    )
+
+    def __init__(self, id, last_trading_day, atm_target_price, atm_iv, call_iv_25d, put_iv_25d, skew_25d, call_volume, put_volume, put_call_volume_ratio, call_positions, put_positions, put_call_positions_ratio, max_pain, updated_at):
+        self.id = id
+        self.last_trading_day = last_trading_day
+        self.atm_target_price = atm_target_price
+        self.atm_iv = atm_iv
+        self.call_iv_25d = call_iv_25d
+        self.put_iv_25d = put_iv_25d
+        self.skew_25d = skew_25d
+        self.call_volume = call_volume
+        self.put_volume = put_volume
+        self.put_call_volume_ratio = put_call_volume_ratio
+        self.call_positions = call_positions
+        self.put_positions = put_positions
+        self.put_call_positions_ratio = put_call_positions_ratio
+        self.max_pain = max_pain
+        self.updated_at = updated_at
+
+    def __repr__(self):
+        return '{}(id={}, last_trading_day={}, atm_target_price={}, atm_iv={}, call_iv_25d={}, put_iv_25d={}, skew_25d={}, call_volume={}, put_volume={}, put_call_volume_ratio={}, call_positions={}, put_positions={}, put_call_positions_ratio={}, max_pain={}, updated_at={})'\
+            .format(self.__class__.__name__, self.id, self.last_trading_day, self.atm_target_price, self.atm_iv, self.call_iv_25d, self.put_iv_25d, self.skew_25d, self.call_volume, self.put_volume, self.put_call_volume_ratio, self.call_positions, self.put_positions, self.put_call_positions_ratio, self.max_pain, self.updated_at)